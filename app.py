@@ -1,17 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from sqlalchemy import inspect
 import re
 import os
+import json
+import time
+import base64
+import binascii
+import hashlib
 from datetime import datetime, timedelta, timezone
-from sqlalchemy import func
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import func, insert, tuple_, case, cast, extract, Float
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from sqlalchemy.schema import CreateIndex
 import logging
-from openai import OpenAI
 from dotenv import load_dotenv
 from pathlib import Path
 import traceback
+from llm_client import get_llm_client
+from llm_providers import LLMRouter
+from chat_cache import create_chat_cache, make_cache_key, LRUTTLCache
+from singleflight import SingleFlight, AsyncSingleFlight
+from crisis import CrisisMatcher, CRISIS_RESPONSE
+from metrics import REGISTRY, StageTimer
+from password_hasher import PasswordHasher, PasswordHasherBusy
+from downsample import lttb
+from mood_analytics import analyze_moods
+from auth_tokens import TokenService, load_secret_key
+from rate_limiter import SlidingWindowLimiter, parse_rule, hash_key
+from db_profile import (database_url_from_env, backend_name, safe_url, postgres_engine_options,
+                        active_postgres_settings, sqlite_pragmas_from_env, sqlite_engine_options,
+                        install_sqlite_pragmas, active_sqlite_pragmas)
 
 # =============================================
 # INITIAL SETUP
@@ -82,7 +105,7 @@ def homepage():
 # =============================================
 
 def initialize_openai():
-    """Initialize OpenAI client without validation checks or verification"""
+    """Initialize the shared, pooled OpenAI client without validation checks or verification"""
     openai_api_key = os.getenv("OPENAI_API_KEY")
     
     if not openai_api_key:
@@ -90,8 +113,8 @@ def initialize_openai():
         return None
         
     try:
-        # Create client with the provided key
-        client = OpenAI(api_key=openai_api_key.strip())
+        # Warm up the process-wide client; request handlers reuse it via get_llm_client()
+        client = get_llm_client()
         logger.info("OpenAI client initialized")
         return client
         
@@ -101,6 +124,17 @@ def initialize_openai():
 
 openai_client = initialize_openai()
 
+# One router per worker, shared by every request thread and by the async chat
+# path in asgi.py. Each provider carries its own circuit breaker, so an
+# upstream outage is detected once instead of per request.
+llm_router = LLMRouter.from_env()
+
+# Completion parameters shared by every chat path
+CHAT_COMPLETION_PARAMS = {
+    "temperature": 0.9,  # More creative responses
+    "max_tokens": 250    # Longer responses
+}
+
 # =============================================
 # DATABASE CONFIGURATION
 # =============================================
@@ -110,11 +144,51 @@ DB_DIR = os.path.join(BASE_DIR, 'instance')
 DB_PATH = os.path.join(DB_DIR, 'users.db')
 os.makedirs(DB_DIR, exist_ok=True)
 
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DB_PATH}"
+# DATABASE_URL selects PostgreSQL; without it the SQLite file above is used
+DATABASE_URL = database_url_from_env(DB_PATH)
+DB_BACKEND = backend_name(DATABASE_URL)
+app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+if DB_BACKEND == "sqlite":
+    # WAL, busy timeout and the other SQLITE_* pragmas on every pooled connection
+    SQLITE_PRAGMAS = sqlite_pragmas_from_env()
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = sqlite_engine_options(SQLITE_PRAGMAS)
+else:
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = postgres_engine_options()
+
 db = SQLAlchemy(app)
+if DB_BACKEND == "sqlite":
+    with app.app_context():
+        install_sqlite_pragmas(db.engine, SQLITE_PRAGMAS)
+
+# bcrypt runs in a bounded process pool so logins don't block request threads.
+# Its cost is calibrated to this host; Flask-Bcrypt is kept on the same cost.
+password_hasher = PasswordHasher.from_env(app.config)
+app.config["BCRYPT_LOG_ROUNDS"] = password_hasher.rounds
 bcrypt = Bcrypt(app)
+REGISTRY.register_collector(password_hasher.collect)
+
+# Signed access/refresh tokens issued by /login. Until AUTH_TOKENS_REQUIRED is
+# set, requests without a bearer token keep trusting the user_id they send.
+app.config["SECRET_KEY"] = load_secret_key(DB_DIR)
+token_service = TokenService.from_env(app.config["SECRET_KEY"])
+AUTH_TOKENS_REQUIRED = os.getenv("AUTH_TOKENS_REQUIRED", "false").lower() in ("1", "true", "yes")
+
+# Sliding-window limits on /login and /register, shared by all workers on the host.
+# Each rule is "attempts/seconds"; "0" disables it.
+auth_rate_limiter = SlidingWindowLimiter.from_env(DB_DIR)
+AUTH_RATE_LIMITS = {
+    "login": (
+        parse_rule("login_ip", os.getenv("LOGIN_RATE_LIMIT_IP", "30/60")),
+        parse_rule("login_email", os.getenv("LOGIN_RATE_LIMIT_EMAIL", "10/300")),
+    ),
+    "register": (
+        parse_rule("register_ip", os.getenv("REGISTER_RATE_LIMIT_IP", "10/600")),
+        parse_rule("register_email", os.getenv("REGISTER_RATE_LIMIT_EMAIL", "5/600")),
+    ),
+}
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", 0))
 
 # =============================================
 # ENHANCED MENTAL HEALTH SUPPORT SYSTEM
@@ -182,16 +256,29 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    timezone = db.Column(db.String(64), nullable=False, default="UTC", server_default="UTC")  # IANA name
+    # Bumped on every password change; refresh tokens issued before it are revoked
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     checkins = db.relationship('CheckIn', backref='user', cascade='all, delete-orphan')
     journal_entries = db.relationship('JournalEntry', backref='user', cascade='all, delete-orphan')
     metrics = db.relationship('ProgressMetric', backref='user', cascade='all, delete-orphan')
     feedback = db.relationship('Feedback', backref='user', cascade='all, delete-orphan')
+    chat_sessions = db.relationship('ChatSession', backref='user', cascade='all, delete-orphan')
+    mood_rollups = db.relationship('MoodRollup', cascade='all, delete-orphan')
+
+    # Emails are unique regardless of case; lookups use find_user_by_email()
+    __table_args__ = (db.Index("ux_users_email_lower", func.lower(email), unique=True),)
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
+        self.token_version = (self.token_version or 0) + 1
+
+    def rehash_password(self, password):
+        """Same password, current hashing cost; outstanding refresh tokens stay valid"""
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
 
     def to_dict(self):
         return {
@@ -199,6 +286,7 @@ class User(db.Model):
             "first_name": self.first_name,
             "last_name": self.last_name,
             "email": self.email,
+            "timezone": self.timezone,
             "created_at": self.created_at.isoformat() if self.created_at else None
         }
 
@@ -211,6 +299,8 @@ class CheckIn(db.Model):
     energy_level = db.Column(db.Integer)
     anxiety_level = db.Column(db.Integer)
     notes = db.Column(db.Text)
+
+    __table_args__ = (db.Index("ix_checkins_user_date", "user_id", "date"),)
     
     def to_dict(self):
         return {
@@ -232,6 +322,9 @@ class JournalEntry(db.Model):
     content = db.Column(db.Text, nullable=False)
     mood = db.Column(db.String(20))
     is_private = db.Column(db.Boolean, default=True)
+
+    # id breaks ties between equal dates, so keyset pages come straight off the index
+    __table_args__ = (db.Index("ix_journal_entries_user_date_id", "user_id", "date", "id"),)
     
     def to_dict(self):
         return {
@@ -251,6 +344,9 @@ class ProgressMetric(db.Model):
     date = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
     metric_type = db.Column(db.String(50), nullable=False)
     value = db.Column(db.Float, nullable=False)
+
+    # Covers get_progress(): the rows come straight from the index, already in date order
+    __table_args__ = (db.Index("ix_progress_metrics_user_date", "user_id", "date", "metric_type", "value"),)
     
     def to_dict(self):
         return {
@@ -261,6 +357,43 @@ class ProgressMetric(db.Model):
             "value": self.value
         }
 
+class MoodRollup(db.Model):
+    """Per-user daily/weekly/monthly aggregates of a progress metric, in the user's timezone"""
+    __tablename__ = "mood_rollups"
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    metric_type = db.Column(db.String(50), primary_key=True)
+    bucket = db.Column(db.String(5), primary_key=True)  # "day", "week" or "month"
+    period_start = db.Column(db.Date, primary_key=True)  # local date the bucket starts on
+    count = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    last_value = db.Column(db.Float, nullable=False)
+    last_at = db.Column(db.DateTime, nullable=False)  # UTC time of last_value
+
+    # "date" and "value" keep the shape of raw ProgressMetric rows for charting
+    @property
+    def date(self):
+        return self.period_start
+
+    @property
+    def value(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            "date": self.period_start.isoformat(),
+            "bucket": self.bucket,
+            "metric_type": self.metric_type,
+            "value": self.value,
+            "count": self.count,
+            "sum": self.total,
+            "avg": self.value,
+            "min": self.min_value,
+            "max": self.max_value,
+            "last": self.last_value
+        }
+
 class Feedback(db.Model):
     __tablename__ = "feedback"
     id = db.Column(db.Integer, primary_key=True)
@@ -269,6 +402,8 @@ class Feedback(db.Model):
     text = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     is_processed = db.Column(db.Boolean, default=False)
+
+    __table_args__ = (db.Index("ix_feedback_user_created", "user_id", "created_at"),)
     
     def to_dict(self):
         return {
@@ -280,9 +415,104 @@ class Feedback(db.Model):
             "is_processed": self.is_processed
         }
 
+class ChatSession(db.Model):
+    __tablename__ = "chat_sessions"
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    emotion = db.Column(db.String(50))
+    summary = db.Column(db.Text)  # rolling summary of turns compacted out of the context window
+    summarized_through = db.Column(db.Integer, default=0, nullable=False)  # last ChatMessage.id folded into summary
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    messages = db.relationship('ChatMessage', backref='session', cascade='all, delete-orphan',
+                               order_by='ChatMessage.id')
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "emotion": self.emotion,
+            "summary": self.summary,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class ChatMessage(db.Model):
+    __tablename__ = "chat_messages"
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('chat_sessions.id'), nullable=False, index=True)
+    role = db.Column(db.String(20), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    token_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "role": self.role,
+            "content": self.content,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+def ensure_columns():
+    """create_all() never alters existing tables, so add columns introduced since"""
+    inspector = db.inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    for table in db.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.error(f"Cannot add {table.name}.{column.name}: NOT NULL without a server default")
+                continue
+            ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(db.engine.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+            if not column.nullable:
+                ddl += " NOT NULL"
+            try:
+                with db.engine.begin() as connection:
+                    connection.exec_driver_sql(ddl)
+                logger.info(f"Added column {table.name}.{column.name}")
+            except (OperationalError, ProgrammingError) as e:
+                # Another worker added it first
+                logger.debug(f"Column {table.name}.{column.name} not added: {str(e.orig)}")
+
+# Indexes replaced by a newer definition; dropped from existing databases
+RETIRED_INDEXES = ["ix_journal_entries_user_date"]
+
+def ensure_indexes():
+    """create_all() skips indexes on tables that already exist, so add any missing ones"""
+    with db.engine.begin() as connection:
+        for name in RETIRED_INDEXES:
+            connection.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+            except IntegrityError as e:
+                logger.error(f"Could not create unique index {index.name}; existing rows conflict: {str(e.orig)}")
+
 def initialize_database():
     with app.app_context():
-        db.create_all()
+        try:
+            db.create_all()
+        except (OperationalError, ProgrammingError, IntegrityError):
+            # Another worker created a table between our check and CREATE TABLE
+            db.create_all()
+        ensure_columns()
+        ensure_indexes()
+        logger.info(f"Database: {safe_url(DATABASE_URL)}")
+        if DB_BACKEND == "sqlite":
+            pragmas = active_sqlite_pragmas(db.engine)
+            logger.info(f"SQLite pragmas: {', '.join(f'{name}={value}' for name, value in pragmas.items())}")
+        else:
+            settings = active_postgres_settings(db.engine)
+            logger.info(f"PostgreSQL settings: {', '.join(f'{name}={value}' for name, value in settings.items())}")
+        logger.info(f"Connection pool: {db.engine.pool.status()}")
         inspector = db.inspect(db.engine)
         table_names = inspector.get_table_names()
         logger.info("Database tables initialized:")
@@ -291,6 +521,9 @@ def initialize_database():
         logger.info(f"- Journal entries table: {'journal_entries' in table_names}")
         logger.info(f"- Progress metrics table: {'progress_metrics' in table_names}")
         logger.info(f"- Feedback table: {'feedback' in table_names}")
+        logger.info(f"- Chat sessions table: {'chat_sessions' in table_names}")
+        logger.info(f"- Chat messages table: {'chat_messages' in table_names}")
+        logger.info(f"- Mood rollups table: {'mood_rollups' in table_names}")
 
 initialize_database()
 
@@ -301,6 +534,277 @@ def validate_password(password):
         return False, "Password must be at least 6 characters"
     return True, ""
 
+def normalize_email(email):
+    return str(email).strip()
+
+def find_user_by_email(email):
+    """Case-insensitive lookup served by the ux_users_email_lower index"""
+    return User.query.filter(func.lower(User.email) == normalize_email(email).lower()).first()
+
+def get_bearer_token(auth_header):
+    if auth_header and auth_header.startswith("Bearer "):
+        return auth_header[7:].strip() or None
+    return None
+
+def authorize_user(requested_user_id, auth_header):
+    """Check a request's bearer token against the user it acts for.
+
+    Returns (user_id, None), or (None, (message, status)) when it must be
+    rejected. user_id comes from the token when one is sent, so clients with
+    a token may omit user_id.
+    """
+    token = get_bearer_token(auth_header)
+    if token is None:
+        if AUTH_TOKENS_REQUIRED:
+            return None, ("Authentication required", 401)
+        return requested_user_id, None
+    token_user_id = token_service.verify_access(token)
+    if token_user_id is None:
+        return None, ("Invalid or expired token", 401)
+    if requested_user_id is not None and str(requested_user_id) != str(token_user_id):
+        return None, ("Token does not match user", 403)
+    return token_user_id, None
+
+def get_client_ip():
+    """Client address, taken from X-Forwarded-For only when we sit behind trusted proxies"""
+    if RATE_LIMIT_TRUSTED_PROXIES > 0:
+        forwarded = [ip.strip() for ip in request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+        if len(forwarded) >= RATE_LIMIT_TRUSTED_PROXIES:
+            return forwarded[-RATE_LIMIT_TRUSTED_PROXIES]
+    return request.remote_addr
+
+def check_auth_rate_limit(action, email):
+    """None if the attempt may proceed, else a 429 response; runs before any DB or bcrypt work"""
+    if auth_rate_limiter is None:
+        return None
+    ip_rule, email_rule = AUTH_RATE_LIMITS[action]
+    allowed, retry_after, rule = auth_rate_limiter.hit(
+        action, [(ip_rule, get_client_ip()), (email_rule, hash_key(email))]
+    )
+    if allowed:
+        return None
+    logger.warning(f"{action.capitalize()} throttled by {rule} for {get_client_ip()}")
+    return jsonify({
+        "success": False,
+        "message": "Too many attempts. Please try again later."
+    }), 429, {"Retry-After": str(int(retry_after + 0.999))}
+
+def error_payload(error):
+    """(body, status, headers) for a (message, status) error; 401s carry the Bearer challenge"""
+    message, status = error
+    headers = {"WWW-Authenticate": "Bearer"} if status == 401 else {}
+    return {"success": False, "message": message}, status, headers
+
+def auth_error_response(error):
+    body, status, headers = error_payload(error)
+    return jsonify(body), status, headers
+
+# Journal listing: keyset pages over (date, id), newest first
+JOURNAL_PAGE_SIZE = int(os.getenv("JOURNAL_PAGE_SIZE", 20))
+JOURNAL_PAGE_MAX_SIZE = int(os.getenv("JOURNAL_PAGE_MAX_SIZE", 100))
+JOURNAL_PREVIEW_CHARS = int(os.getenv("JOURNAL_PREVIEW_CHARS", 200))
+
+def encode_cursor(date, entry_id):
+    raw = json.dumps([date.isoformat(), entry_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """(date, id) from a cursor made by encode_cursor(); raises ValueError if it is malformed"""
+    try:
+        date, entry_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(date), int(entry_id)
+    except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+def parse_local_datetime(value, zone):
+    """ISO date or datetime from a query string as aware UTC; naive values are in the user's zone"""
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=zone)
+    return moment.astimezone(timezone.utc)
+
+def journal_summary(row):
+    preview = row.preview or ""
+    truncated = len(preview) > JOURNAL_PREVIEW_CHARS
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "date": row.date.isoformat() if row.date else None,
+        "title": row.title,
+        "mood": row.mood,
+        "is_private": row.is_private,
+        "preview": preview[:JOURNAL_PREVIEW_CHARS] + ("…" if truncated else ""),
+        "truncated": truncated
+    }
+
+
+# =============================================
+# MOOD ROLLUPS
+# =============================================
+#
+# create_checkin() folds every metric into per-user day, week (Monday) and
+# month rollups in the same transaction, with one INSERT ... ON CONFLICT DO
+# UPDATE. Buckets follow the user's own timezone. GET /api/progress?bucket=...
+# then reads at most one small row per period instead of every raw metric.
+#
+# Date filters on the progress and journal paths are half-open UTC ranges,
+# date >= start AND date < end, with day boundaries at the user's local
+# midnight. They compare the bare column, so the (user_id, date) indexes can
+# seek straight to the range; func.date(column) would convert every row.
+# rebuild_mood_rollups() recomputes them from progress_metrics: run it
+# (python rebuild_rollups.py) after loading metrics some other way. It also
+# runs when a user changes timezone.
+
+ROLLUP_BUCKETS = ("day", "week", "month")
+
+def user_zone(name):
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("UTC")
+
+def is_valid_timezone(name):
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return False
+
+def bucket_start(local_date, bucket):
+    if bucket == "week":
+        return local_date - timedelta(days=local_date.weekday())
+    if bucket == "month":
+        return local_date.replace(day=1)
+    return local_date
+
+def as_naive_utc(moment):
+    # Timestamps are stored as naive UTC
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo else moment
+
+def local_midnight(day, zone):
+    """Start of a calendar day in zone, as an aware UTC datetime"""
+    return datetime(day.year, day.month, day.day, tzinfo=zone).astimezone(timezone.utc)
+
+def local_day_range(day, zone):
+    """[start, end) of a calendar day in zone, in UTC; not always 24 hours across DST changes"""
+    return local_midnight(day, zone), local_midnight(day + timedelta(days=1), zone)
+
+def record_rollups(user, metric_type, value, at):
+    """Fold one metric into the user's rollups; runs in the caller's transaction"""
+    local_date = at.astimezone(user_zone(user.timezone)).date()
+    at = as_naive_utc(at)
+    upsert = postgresql_insert if DB_BACKEND == "postgresql" else sqlite_insert
+    statement = upsert(MoodRollup).values([{
+        "user_id": user.id, "metric_type": metric_type, "bucket": bucket,
+        "period_start": bucket_start(local_date, bucket), "count": 1, "total": value,
+        "min_value": value, "max_value": value, "last_value": value, "last_at": at
+    } for bucket in ROLLUP_BUCKETS])
+    new, current = statement.excluded, MoodRollup.__table__.c
+    newer = new.last_at >= current.last_at
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[current.user_id, current.metric_type, current.bucket, current.period_start],
+        set_={
+            "count": current.count + new.count,
+            "total": current.total + new.total,
+            "min_value": case((new.min_value < current.min_value, new.min_value), else_=current.min_value),
+            "max_value": case((new.max_value > current.max_value, new.max_value), else_=current.max_value),
+            "last_value": case((newer, new.last_value), else_=current.last_value),
+            "last_at": case((newer, new.last_at), else_=current.last_at)
+        }
+    ))
+
+def rebuild_mood_rollups(user_ids=None, chunk_size=500):
+    """Recompute rollups from progress_metrics for user_ids (default: everyone); returns rows written"""
+    if user_ids is None:
+        user_ids = db.session.scalars(db.select(User.id).order_by(User.id)).all()
+    written = 0
+    for offset in range(0, len(user_ids), chunk_size):
+        chunk = list(user_ids[offset:offset + chunk_size])
+        zones = {uid: user_zone(tz) for uid, tz in db.session.execute(
+            db.select(User.id, User.timezone).where(User.id.in_(chunk)))}
+        metrics = db.session.execute(
+            db.select(ProgressMetric.user_id, ProgressMetric.metric_type, ProgressMetric.date, ProgressMetric.value)
+            .where(ProgressMetric.user_id.in_(chunk))
+            .order_by(ProgressMetric.user_id, ProgressMetric.date)
+        )
+        rollups = {}
+        for uid, metric_type, at, value in metrics:
+            local_date = at.replace(tzinfo=timezone.utc).astimezone(zones[uid]).date()
+            for bucket in ROLLUP_BUCKETS:
+                key = (uid, metric_type, bucket, bucket_start(local_date, bucket))
+                row = rollups.get(key)
+                if row is None:
+                    rollups[key] = [1, value, value, value, value, at]
+                else:
+                    row[0] += 1
+                    row[1] += value
+                    row[2] = min(row[2], value)
+                    row[3] = max(row[3], value)
+                    row[4], row[5] = value, at  # rows arrive in date order
+
+        db.session.execute(db.delete(MoodRollup).where(MoodRollup.user_id.in_(chunk)))
+        if rollups:
+            db.session.execute(db.insert(MoodRollup), [{
+                "user_id": uid, "metric_type": metric_type, "bucket": bucket, "period_start": start,
+                "count": count, "total": total, "min_value": low, "max_value": high,
+                "last_value": last, "last_at": last_at
+            } for (uid, metric_type, bucket, start), (count, total, low, high, last, last_at) in rollups.items()])
+        db.session.commit()
+        written += len(rollups)
+    return written
+
+# time_range windows start at the user's local midnight this many days ago
+TIME_RANGE_DAYS = {"day": 0, "week": 7, "month": 30, "year": 365}
+
+def requested_range(args, zone):
+    """[start, end) from the from/to query parameters as aware UTC datetimes; None means unbounded"""
+    bounds = []
+    for name in ("from", "to"):
+        value = args.get(name)
+        try:
+            bounds.append(parse_local_datetime(value, zone) if value else None)
+        except ValueError:
+            raise ValueError(f"Invalid '{name}' date; use YYYY-MM-DD or an ISO 8601 datetime")
+    if bounds[0] and bounds[1] and bounds[0] >= bounds[1]:
+        raise ValueError("'from' must be before 'to'")
+    return bounds[0], bounds[1]
+
+def progress_range(args, zone):
+    """[start, end) for GET /api/progress, from from/to or from time_range"""
+    if args.get("from") or args.get("to"):
+        return requested_range(args, zone)
+    days = TIME_RANGE_DAYS.get(args.get("time_range", "week"))
+    if days is None:
+        return None, None
+    return local_midnight(datetime.now(zone).date() - timedelta(days=days), zone), None
+
+def downsample_metrics(metrics, max_points):
+    """Shrink each metric type's series that is longer than max_points with LTTB
+
+    Returns the points as dicts in date order, and whether any series shrank.
+    Points of a shrunk series get "merged": how many points each stands for
+    and the dates of the first and last of them.
+    """
+    series = {}
+    for metric in metrics:
+        series.setdefault(metric.metric_type, []).append(metric)
+    points = []
+    shrank = False
+    for rows in series.values():
+        if len(rows) <= max_points:
+            points.extend((row.date, row.to_dict()) for row in rows)
+            continue
+        shrank = True
+        kept, first, last = lttb([row.date for row in rows], [row.value for row in rows], max_points)
+        # Only the kept rows are serialized
+        for index, start, end in zip(kept.tolist(), first.tolist(), last.tolist()):
+            point = rows[index].to_dict()
+            point["merged"] = {"count": end - start + 1, "from": rows[start].date.isoformat(),
+                               "to": rows[end].date.isoformat()}
+            points.append((rows[index].date, point))
+    points.sort(key=lambda item: item[0])
+    return [point for _, point in points], shrank
+
 
 # Enhanced mental health support prompts
 MENTAL_HEALTH_PROMPTS = {
@@ -423,6 +927,10 @@ def register():
         if not all(field in data for field in required):
             return jsonify({"success": False, "message": "All fields are required"}), 400
 
+        throttled = check_auth_rate_limit("register", data["email"])
+        if throttled:
+            return throttled
+
         if not re.match(r"[^@]+@[^@]+\.[^@]+", data["email"]):
             return jsonify({"success": False, "message": "Invalid email format"}), 400
 
@@ -430,25 +938,37 @@ def register():
         if not is_valid:
             return jsonify({"success": False, "message": msg}), 400
 
-        if User.query.filter_by(email=data["email"]).first():
-            return jsonify({"success": False, "message": "Email already registered"}), 409
+        if data.get("timezone") and not is_valid_timezone(data["timezone"]):
+            return jsonify({"success": False, "message": "Invalid timezone"}), 400
 
-        user = User(
-            first_name=data["first_name"],
-            last_name=data["last_name"],
-            email=data["email"]
-        )
-        user.set_password(data["password"])
-        db.session.add(user)
-        db.session.commit()
+        # One INSERT ... RETURNING: the unique lower(email) index rejects
+        # duplicates atomically, and the new row comes back without a SELECT
+        try:
+            user = db.session.scalar(insert(User).values(
+                first_name=data["first_name"],
+                last_name=data["last_name"],
+                email=normalize_email(data["email"]),
+                timezone=data.get("timezone") or "UTC",
+                password_hash=password_hasher.hash(data["password"])
+            ).returning(User))
+            user_data = user.to_dict()
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            logger.info(f"Registration rejected - email already registered: {data['email']}")
+            return jsonify({"success": False, "message": "Email already registered"}), 409
 
-        logger.info(f"New user registered: {user.email}")
+        logger.info(f"New user registered: {user_data['email']}")
         return jsonify({
             "success": True,
             "message": "Registration successful",
-            "user": user.to_dict()
+            "user": user_data
         }), 201
 
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        logger.warning(f"Registration deferred - password hashing busy ({e.reason})")
+        return jsonify({"success": False, "message": "Server is busy. Please try again shortly."}), 503, {"Retry-After": "1"}
     except Exception as e:
         db.session.rollback()
         logger.error(f"Registration failed: {str(e)}")
@@ -469,7 +989,11 @@ def login():
         if not all(field in data for field in ["email", "password"]):
             return jsonify({"success": False, "message": "Email and password are required"}), 400
 
-        user = User.query.filter_by(email=data["email"]).first()
+        throttled = check_auth_rate_limit("login", data["email"])
+        if throttled:
+            return throttled
+
+        user = find_user_by_email(data["email"])
         if not user:
             logger.warning(f"Login failed - user not found: {data['email']}")
             return jsonify({"success": False, "message": "Invalid email or password"}), 401
@@ -478,13 +1002,27 @@ def login():
             logger.warning(f"Login failed - incorrect password for: {data['email']}")
             return jsonify({"success": False, "message": "Invalid email or password"}), 401
 
+        # Upgrade hashes made with an older, cheaper cost while we have the password
+        if password_hasher.needs_rehash(user.password_hash):
+            try:
+                user.rehash_password(data["password"])
+                db.session.commit()
+                logger.info(f"Password hash upgraded to cost {password_hasher.rounds} for: {user.email}")
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Password rehash skipped for {user.email}: {str(e)}")
+
         logger.info(f"User logged in: {user.email}")
         return jsonify({
             "success": True,
             "message": "Login successful",
-            "user": user.to_dict()
+            "user": user.to_dict(),
+            **token_service.issue(user)
         }), 200
 
+    except PasswordHasherBusy as e:
+        logger.warning(f"Login deferred - password hashing busy ({e.reason})")
+        return jsonify({"success": False, "message": "Server is busy. Please try again shortly."}), 503, {"Retry-After": "1"}
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         return jsonify({
@@ -492,13 +1030,47 @@ def login():
             "message": "Login failed. Please try again."
         }), 500
 
+@app.route("/api/token/refresh", methods=["POST"])
+def refresh_token():
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get("refresh_token"):
+            return jsonify({"success": False, "message": "Refresh token is required"}), 400
+
+        claims = token_service.verify_refresh(data["refresh_token"])
+        user = db.session.get(User, claims[0]) if claims else None
+        # A password change since the token was issued revokes it
+        if not user or claims[1] != user.token_version:
+            return auth_error_response(("Invalid or expired refresh token", 401))
+
+        return jsonify({"success": True, **token_service.issue(user)})
+
+    except Exception as e:
+        logger.error(f"Token refresh error: {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": "Token refresh failed"
+        }), 500
+
 @app.route("/api/user/profile", methods=["PUT"])
 def update_profile():
     try:
         data = request.get_json()
         logger.debug(f"Profile update request: {data}")
+
+        # A valid bearer token stands in for current_password, except for password changes
+        auth_header = request.headers.get("Authorization")
+        token_auth = get_bearer_token(auth_header) is not None
+        if token_auth:
+            user_id, auth_error = authorize_user(data.get("id"), auth_header)
+            if auth_error:
+                return auth_error_response(auth_error)
+            data["id"] = user_id
         
-        required_fields = ["id", "current_password", "first_name", "last_name", "email"]
+        required_fields = ["id", "first_name", "last_name", "email"]
+        password_required = not token_auth or bool(data.get("new_password"))
+        if password_required:
+            required_fields.append("current_password")
         if not all(field in data for field in required_fields):
             return jsonify({"success": False, "message": "All fields are required"}), 400
 
@@ -507,17 +1079,24 @@ def update_profile():
             logger.warning(f"Profile update failed - user not found: {data['id']}")
             return jsonify({"success": False, "message": "User not found"}), 404
         
-        if not user.check_password(data["current_password"]):
+        if password_required and not user.check_password(data["current_password"]):
             logger.warning(f"Profile update failed - incorrect password for user: {user.email}")
             return jsonify({"success": False, "message": "Current password is incorrect"}), 401
 
-        if user.email != data["email"] and User.query.filter_by(email=data["email"]).first():
+        existing = find_user_by_email(data["email"])
+        if existing and existing.id != user.id:
             logger.warning(f"Profile update failed - email already in use: {data['email']}")
             return jsonify({"success": False, "message": "Email already in use"}), 409
 
+        if data.get("timezone") and not is_valid_timezone(data["timezone"]):
+            return jsonify({"success": False, "message": "Invalid timezone"}), 400
+
         user.first_name = data["first_name"]
         user.last_name = data["last_name"]
-        user.email = data["email"]
+        user.email = normalize_email(data["email"])
+        timezone_changed = bool(data.get("timezone")) and data["timezone"] != user.timezone
+        if timezone_changed:
+            user.timezone = data["timezone"]
 
         if data.get("new_password"):
             is_valid, msg = validate_password(data["new_password"])
@@ -525,15 +1104,31 @@ def update_profile():
                 return jsonify({"success": False, "message": msg}), 400
             user.set_password(data["new_password"])
 
+        if timezone_changed:
+            # Rollup buckets follow the user's timezone; recompute them (this commits)
+            rebuild_mood_rollups([user.id])
         db.session.commit()
         logger.info(f"Profile updated successfully for user: {user.email}")
         
-        return jsonify({
+        result = {
             "success": True,
             "message": "Profile updated successfully",
             "user": user.to_dict()
-        })
+        }
+        if data.get("new_password"):
+            # The password change revoked earlier refresh tokens; hand out a fresh pair
+            result.update(token_service.issue(user))
+        return jsonify(result)
 
+    except IntegrityError:
+        # Lost a race with another account claiming the same email
+        db.session.rollback()
+        logger.warning(f"Profile update failed - email already in use: {data.get('email')}")
+        return jsonify({"success": False, "message": "Email already in use"}), 409
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        logger.warning(f"Profile update deferred - password hashing busy ({e.reason})")
+        return jsonify({"success": False, "message": "Server is busy. Please try again shortly."}), 503, {"Retry-After": "1"}
     except Exception as e:
         db.session.rollback()
         logger.error(f"Profile update error: {str(e)}")
@@ -563,6 +1158,9 @@ def debug_user(user_id):
 @app.route("/api/user/<int:user_id>", methods=["DELETE"])
 def delete_account(user_id):
     try:
+        _, auth_error = authorize_user(user_id, request.headers.get("Authorization"))
+        if auth_error:
+            return auth_error_response(auth_error)
         user = db.session.get(User, user_id)
         if not user:
             logger.warning(f"Delete account failed - user not found: {user_id}")
@@ -585,6 +1183,11 @@ def delete_account(user_id):
 def create_checkin():
     try:
         data = request.get_json()
+        user_id, auth_error = authorize_user(data.get("user_id"), request.headers.get("Authorization"))
+        if auth_error:
+            return auth_error_response(auth_error)
+        if user_id is not None:
+            data["user_id"] = user_id
         logger.debug(f"New check-in for user: {data.get('user_id')}")
         
         if not all(field in data for field in ["user_id", "mood"]):
@@ -596,8 +1199,14 @@ def create_checkin():
                 "message": f"Invalid mood. Must be one of: {', '.join(VALID_MOODS)}"
             }), 400
             
+        user = db.session.get(User, data["user_id"])
+        if not user:
+            return jsonify({"success": False, "message": "User not found"}), 404
+
+        now = datetime.now(timezone.utc)
         checkin = CheckIn(
-            user_id=data["user_id"],
+            user_id=user.id,
+            date=now,
             mood=data["mood"],
             energy_level=data.get("energy_level"),
             anxiety_level=data.get("anxiety_level"),
@@ -607,11 +1216,13 @@ def create_checkin():
         db.session.add(checkin)
         
         metric = ProgressMetric(
-            user_id=data["user_id"],
+            user_id=user.id,
+            date=now,
             metric_type="mood",
             value=MOOD_VALUES[data["mood"]]
         )
         db.session.add(metric)
+        record_rollups(user, metric.metric_type, metric.value, now)
         db.session.commit()
         
         logger.info(f"Check-in created for user: {data['user_id']}")
@@ -636,6 +1247,11 @@ def handle_journal():
         
     try:
         data = request.get_json()
+        user_id, auth_error = authorize_user(data.get("user_id"), request.headers.get("Authorization"))
+        if auth_error:
+            return auth_error_response(auth_error)
+        if user_id is not None:
+            data["user_id"] = user_id
         logger.debug(f"New journal entry for user: {data.get('user_id')}")
         
         if not all(field in data for field in ["user_id", "title", "content"]):
@@ -670,13 +1286,61 @@ def handle_journal():
 @app.route("/api/journal/<int:user_id>", methods=["GET"])
 def get_journal_entries(user_id):
     try:
-        entries = JournalEntry.query.filter_by(user_id=user_id)\
-            .order_by(JournalEntry.date.desc()).all()
-            
+        _, auth_error = authorize_user(user_id, request.headers.get("Authorization"))
+        if auth_error:
+            return auth_error_response(auth_error)
+
+        limit = request.args.get("limit", JOURNAL_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, JOURNAL_PAGE_MAX_SIZE))
+        summary = request.args.get("fields", "full") == "summary"
+
+        if summary:
+            # Only a prefix of each body leaves the database
+            query = db.select(
+                JournalEntry.id, JournalEntry.user_id, JournalEntry.date, JournalEntry.title,
+                JournalEntry.mood, JournalEntry.is_private,
+                func.substr(JournalEntry.content, 1, JOURNAL_PREVIEW_CHARS + 1).label("preview")
+            )
+        else:
+            query = db.select(JournalEntry)
+        query = query.where(JournalEntry.user_id == user_id)
+
+        if request.args.get("from") or request.args.get("to"):
+            zone = user_zone(db.session.scalar(db.select(User.timezone).where(User.id == user_id)))
+            try:
+                start, end = requested_range(request.args, zone)
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+            if start:
+                query = query.where(JournalEntry.date >= as_naive_utc(start))
+            if end:
+                query = query.where(JournalEntry.date < as_naive_utc(end))
+
+        cursor = request.args.get("cursor")
+        if cursor:
+            try:
+                before_date, before_id = decode_cursor(cursor)
+            except ValueError:
+                return jsonify({"success": False, "message": "Invalid cursor"}), 400
+            query = query.where(tuple_(JournalEntry.date, JournalEntry.id) < (before_date, before_id))
+
+        # One extra row tells us whether another page exists
+        query = query.order_by(JournalEntry.date.desc(), JournalEntry.id.desc()).limit(limit + 1)
+        if summary:
+            rows = db.session.execute(query).all()
+            entries = [journal_summary(row) for row in rows[:limit]]
+        else:
+            rows = db.session.scalars(query).all()
+            entries = [entry.to_dict() for entry in rows[:limit]]
+
+        has_more = len(rows) > limit
+        last = rows[limit - 1] if has_more else None
         logger.debug(f"Retrieved {len(entries)} journal entries for user: {user_id}")
         return jsonify({
             "success": True,
-            "entries": [entry.to_dict() for entry in entries]
+            "entries": entries,
+            "has_more": has_more,
+            "next_cursor": encode_cursor(last.date, last.id) if last else None
         })
         
     except Exception as e:
@@ -686,37 +1350,93 @@ def get_journal_entries(user_id):
             "message": "Failed to fetch journal entries"
         }), 500
 
+@app.route("/api/journal/<int:user_id>/<int:entry_id>", methods=["GET"])
+def get_journal_entry(user_id, entry_id):
+    try:
+        _, auth_error = authorize_user(user_id, request.headers.get("Authorization"))
+        if auth_error:
+            return auth_error_response(auth_error)
+        entry = db.session.get(JournalEntry, entry_id)
+        if not entry or entry.user_id != user_id:
+            return jsonify({"success": False, "message": "Journal entry not found"}), 404
+        return jsonify({"success": True, "entry": entry.to_dict()})
+
+    except Exception as e:
+        logger.error(f"Journal entry retrieval error: {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": "Failed to fetch journal entry"
+        }), 500
+
 @app.route("/api/progress/<int:user_id>", methods=["GET"])
 def get_progress(user_id):
     try:
-        today = datetime.now(timezone.utc).date()
-        today_metric = ProgressMetric.query.filter(
+        _, auth_error = authorize_user(user_id, request.headers.get("Authorization"))
+        if auth_error:
+            return auth_error_response(auth_error)
+        user = db.session.get(User, user_id)
+        zone = user_zone(user.timezone if user else None)
+        metric_type = request.args.get("metric_type")
+
+        # Latest reading of the user's local today
+        day_start, day_end = local_day_range(datetime.now(zone).date(), zone)
+        query = ProgressMetric.query.filter(
             ProgressMetric.user_id == user_id,
-            func.date(ProgressMetric.date) == today
-        ).first()
-        
-        time_range = request.args.get("time_range", "week")
-        query = ProgressMetric.query.filter_by(user_id=user_id)
-        
-        if time_range == "week":
-            start_date = datetime.now(timezone.utc) - timedelta(days=7)
-        elif time_range == "month":
-            start_date = datetime.now(timezone.utc) - timedelta(days=30)
-        elif time_range == "year":
-            start_date = datetime.now(timezone.utc) - timedelta(days=365)
+            ProgressMetric.date >= as_naive_utc(day_start),
+            ProgressMetric.date < as_naive_utc(day_end)
+        )
+        if metric_type:
+            query = query.filter(ProgressMetric.metric_type == metric_type)
+        today_metric = query.order_by(ProgressMetric.date.desc()).first()
+
+        bucket = request.args.get("bucket")
+        if bucket and bucket not in ROLLUP_BUCKETS:
+            return jsonify({"success": False, "message": f"bucket must be one of: {', '.join(ROLLUP_BUCKETS)}"}), 400
+        max_points = request.args.get("max_points", type=int)
+        if "max_points" in request.args and (max_points is None or max_points < 3):
+            return jsonify({"success": False, "message": "max_points must be a whole number of at least 3"}), 400
+        try:
+            start, end = progress_range(request.args, zone)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        if bucket:
+            # Every bucket that overlaps [start, end), one row per period
+            query = MoodRollup.query.filter_by(user_id=user_id, metric_type=metric_type or "mood", bucket=bucket)
+            if start:
+                query = query.filter(MoodRollup.period_start >= bucket_start(start.astimezone(zone).date(), bucket))
+            if end:
+                last_day = (end - timedelta(microseconds=1)).astimezone(zone).date()
+                query = query.filter(MoodRollup.period_start < last_day + timedelta(days=1))
+            metrics = query.order_by(MoodRollup.period_start.asc()).all()
         else:
-            start_date = None
-            
-        if start_date:
-            query = query.filter(ProgressMetric.date >= start_date)
-            
-        metrics = query.order_by(ProgressMetric.date.asc()).all()
+            query = ProgressMetric.query.filter_by(user_id=user_id)
+            if metric_type:
+                query = query.filter(ProgressMetric.metric_type == metric_type)
+            if start:
+                query = query.filter(ProgressMetric.date >= as_naive_utc(start))
+            if end:
+                query = query.filter(ProgressMetric.date < as_naive_utc(end))
+            metrics = query.order_by(ProgressMetric.date.asc()).all()
+
+        downsampled = None
+        if max_points and len(metrics) > max_points:
+            # The cap is per metric type, so several short series can add up past it
+            historical, shrank = downsample_metrics(metrics, max_points)
+            if shrank:
+                downsampled = {"algorithm": "lttb", "max_points": max_points,
+                               "original_points": len(metrics), "points": len(historical)}
+        else:
+            historical = [m.to_dict() for m in metrics]
         
-        logger.debug(f"Retrieved progress data for user: {user_id}, time range: {time_range}")
+        logger.debug(f"Retrieved progress data for user: {user_id}, range: {start} - {end}, bucket: {bucket}")
         return jsonify({
             "success": True,
             "today": today_metric.to_dict() if today_metric else None,
-            "historical": [m.to_dict() for m in metrics]
+            "historical": historical,
+            "bucket": bucket,
+            "timezone": zone.key,
+            "downsampled": downsampled
         })
         
     except Exception as e:
@@ -726,6 +1446,90 @@ def get_progress(user_id):
             "message": "Failed to fetch progress data"
         }), 500
 
+# =============================================
+# MOOD ANALYTICS
+# =============================================
+#
+# GET /api/analytics/<user_id> returns moving averages, the check-in streak,
+# the week-over-week trend and the energy/anxiety correlations
+# (mood_analytics.py). Results are memoized per process. The cache key
+# includes the user's check-in count and latest check-in time, so a new
+# check-in invalidates the entry in every worker. That lookup is a single
+# read of ix_checkins_user_date. The key also includes the user's local date
+# and timezone, because streaks and trends move at local midnight.
+
+ANALYTICS_DAYS = 90
+ANALYTICS_MAX_DAYS = 366
+analytics_cache = LRUTTLCache(
+    max_entries=int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", 1024)),
+    ttl=float(os.getenv("ANALYTICS_CACHE_TTL", 3600))
+)
+
+def epoch_seconds(column):
+    """A naive UTC timestamp column as seconds since the epoch (whole seconds on SQLite)"""
+    return cast(extract("epoch", column), Float)
+
+def collect_analytics_state():
+    cache_stats = analytics_cache.stats()
+    return [
+        ("analytics_cache_entries", "gauge", "Entries in the mood analytics cache", [({}, cache_stats["size"])]),
+        ("analytics_cache_lookups_total", "counter", "Mood analytics cache lookups by result",
+         [({"result": "hit"}, cache_stats["hits"]), ({"result": "miss"}, cache_stats["misses"])]),
+    ]
+
+REGISTRY.register_collector(collect_analytics_state)
+
+@app.route("/api/analytics/<int:user_id>", methods=["GET"])
+def get_analytics(user_id):
+    try:
+        _, auth_error = authorize_user(user_id, request.headers.get("Authorization"))
+        if auth_error:
+            return auth_error_response(auth_error)
+        days = request.args.get("days", ANALYTICS_DAYS, type=int)
+        if not 1 <= days <= ANALYTICS_MAX_DAYS:
+            return jsonify({"success": False, "message": f"days must be between 1 and {ANALYTICS_MAX_DAYS}"}), 400
+
+        user = db.session.get(User, user_id)
+        if not user:
+            return jsonify({"success": False, "message": "User not found"}), 404
+        zone = user_zone(user.timezone)
+        today = datetime.now(zone).date()
+
+        checkin_count, last_checkin = db.session.execute(
+            db.select(func.count(), func.max(CheckIn.date)).where(CheckIn.user_id == user_id)
+        ).one()
+        cache_key = (user_id, checkin_count, last_checkin, zone.key, today, days)
+        analytics = analytics_cache.get(cache_key)
+        cached = analytics is not None
+        if not cached:
+            # Epoch seconds straight from the database: no datetime object per row
+            checkins = db.session.execute(
+                db.select(epoch_seconds(CheckIn.date), CheckIn.mood, CheckIn.energy_level, CheckIn.anxiety_level)
+                .where(CheckIn.user_id == user_id).order_by(CheckIn.date.asc())
+            ).all()
+            metrics = db.session.execute(
+                db.select(epoch_seconds(ProgressMetric.date), ProgressMetric.value)
+                .where(ProgressMetric.user_id == user_id, ProgressMetric.metric_type == "mood")
+                .order_by(ProgressMetric.date.asc())
+            ).all()
+            analytics = analyze_moods(checkins, metrics, MOOD_VALUES, zone, today, days)
+            analytics_cache.set(cache_key, analytics)
+
+        logger.debug(f"Analytics for user: {user_id} ({'cached' if cached else 'computed'})")
+        return jsonify({
+            "success": True,
+            "analytics": analytics,
+            "cached": cached,
+            "timezone": zone.key
+        })
+
+    except Exception as e:
+        logger.error(f"Analytics error: {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": "Failed to compute analytics"
+        }), 500
+
 @app.route("/logout", methods=["POST"])
 def logout():
     try:
@@ -746,6 +1550,11 @@ def logout():
 def submit_feedback():
     try:
         data = request.get_json()
+        user_id, auth_error = authorize_user(data.get("user_id"), request.headers.get("Authorization"))
+        if auth_error:
+            return auth_error_response(auth_error)
+        if user_id is not None:
+            data["user_id"] = user_id
         logger.debug(f"New feedback from user: {data.get('user_id')}")
         
         if not all(field in data for field in ["user_id", "emotion", "text"]):
@@ -782,73 +1591,525 @@ def submit_feedback():
 # ENHANCED CHAT ENDPOINT WITH EMOTION SUPPORT
 # =============================================
 
-@app.route("/api/chat", methods=["POST"])
-def chat_with_ai():
-    try:
-        data = request.get_json()
-        logger.debug(f"AI chat request from user: {data.get('user_id')}")
-        
-        # Validate required fields
-        if not all(field in data for field in ["user_id", "message"]):
-            return jsonify({"success": False, "message": "User ID and message are required"}), 400
-
-        # Get emotion or use default
-        emotion = data.get("emotion", "default")
-        if emotion not in VALID_MOODS:
-            emotion = "Unknown"  # Handle unrecognized emotions
-            
-        # Prepare system prompt based on emotion
-        system_prompt = MENTAL_HEALTH_PROMPTS.get(emotion, MENTAL_HEALTH_PROMPTS["default"])
-        
-        # Add conversation context
-        messages = [{"role": "system", "content": system_prompt}]
-        
+# Optional response cache for repeated openers (CHAT_CACHE_ENABLED=true).
+# By default only requests without conversation history are cacheable.
+chat_cache = create_chat_cache(DB_DIR)
+CHAT_CACHE_MAX_HISTORY = int(os.getenv("CHAT_CACHE_MAX_HISTORY", 0))
+
+# Crisis-language phrase list, compiled once and hot-reloaded when the file changes
+crisis_matcher = CrisisMatcher.from_env(os.path.join(BASE_DIR, "crisis_phrases.txt"))
+
+# Identical concurrent completions in this worker share one upstream call
+# (the async group is used by asgi.py's event-loop chat path)
+chat_singleflight = SingleFlight()
+async_chat_singleflight = AsyncSingleFlight()
+
+# =============================================
+# CHAT PIPELINE METRICS
+# =============================================
+#
+# Every chat request is split into stages (parse, crisis_check, session,
+# prompt_assembly, cache_lookup, upstream, fallback, session_save) and each
+# stage's time goes into chat_stage_seconds; connect time and time to first
+# token are recorded by llm_client / llm_providers. Token usage is labelled
+# with a short hash of the emotion's system prompt so the cost of a change to
+# MENTAL_HEALTH_PROMPTS shows up as a new series. Scrape GET /metrics.
+
+CHAT_STAGE_SECONDS = REGISTRY.histogram("chat_stage_seconds", "Time spent in each /api/chat stage", ["stage"])
+CHAT_REQUEST_SECONDS = REGISTRY.histogram("chat_request_seconds", "End-to-end /api/chat latency", ["source"])
+CHAT_REPLIES = REGISTRY.counter(
+    "chat_replies_total", "Chat replies by emotion and source (model, cached, fallback, crisis)", ["emotion", "source"]
+)
+CHAT_TOKENS = REGISTRY.counter(
+    "chat_tokens_total", "Upstream tokens used by chat", ["emotion", "prompt_version", "kind"]
+)
+CHAT_SLOW_LOG_SECONDS = float(os.getenv("CHAT_SLOW_LOG_SECONDS", 5))
+
+def resolve_emotion(data):
+    emotion = data.get("emotion", "default")
+    return emotion if emotion in VALID_MOODS else "Unknown"
+
+def prompt_version(emotion):
+    """Short hash of the system prompt this emotion uses"""
+    prompt = MENTAL_HEALTH_PROMPTS.get(emotion, MENTAL_HEALTH_PROMPTS["default"])
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+
+def record_chat_usage(emotion, prompt_tokens, completion_tokens):
+    if prompt_tokens is None:
+        return
+    version = prompt_version(emotion)
+    CHAT_TOKENS.inc(prompt_tokens, emotion=emotion, prompt_version=version, kind="prompt")
+    CHAT_TOKENS.inc(completion_tokens or 0, emotion=emotion, prompt_version=version, kind="completion")
+
+def finish_chat_metrics(timer, emotion, source):
+    """Record the reply source and end-to-end latency; log a stage breakdown for slow requests"""
+    total = timer.total()
+    CHAT_REPLIES.inc(emotion=emotion, source=source)
+    CHAT_REQUEST_SECONDS.observe(total, source=source)
+    if total >= CHAT_SLOW_LOG_SECONDS:
+        logger.warning(f"Slow chat request ({total:.2f}s, {source}): {timer.describe()}")
+
+def collect_chat_state():
+    """Scrape-time gauges for breakers, cache, coalescing and crisis matching"""
+    breaker_states = {"closed": 0, "half_open": 1, "open": 2}
+    families = [(
+        "llm_breaker_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+        [({"provider": p.name}, breaker_states.get(p.breaker.state, 0)) for p in llm_router.providers]
+    )]
+    if chat_cache:
+        cache_stats = chat_cache.stats()
+        families.append(("chat_cache_entries", "gauge", "Entries in the chat response cache",
+                         [({}, cache_stats["size"])]))
+        families.append(("chat_cache_lookups_total", "counter", "Chat cache lookups by result",
+                         [({"result": "hit"}, cache_stats["hits"]),
+                          ({"result": "miss"}, cache_stats["misses"])]))
+    coalescing = [("sync", chat_singleflight.stats()), ("async", async_chat_singleflight.stats())]
+    families.append(("chat_coalesced_total", "counter", "Chat completions that joined an identical in-flight call",
+                     [({"mode": mode}, stats["coalesced"]) for mode, stats in coalescing]))
+    families.append(("chat_in_flight", "gauge", "Distinct upstream chat completions in flight",
+                     [({"mode": mode}, stats["in_flight"]) for mode, stats in coalescing]))
+    families.append(("crisis_phrases", "gauge", "Crisis phrases currently loaded",
+                     [({}, crisis_matcher.stats()["phrases"])]))
+    return families
+
+REGISTRY.register_collector(collect_chat_state)
+
+# =============================================
+# SERVER-SIDE CHAT SESSIONS
+# =============================================
+#
+# Clients send {"new_session": true} once and then only {"session_id": ...}
+# with each message instead of resending the whole conversation. History is
+# assembled newest-first until CHAT_CONTEXT_TOKEN_BUDGET is spent; turns that
+# no longer fit are folded into the session's rolling summary (itself capped
+# at CHAT_SUMMARY_TOKEN_BUDGET), so prompt size per turn stays bounded.
+
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 1200))
+CHAT_SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", 300))
+CHAT_SUMMARY_LINE_CHARS = 160
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token plus per-message overhead)"""
+    return len(text) // 4 + 4
+
+def compact_into_summary(summary, messages):
+    """Fold dropped turns into the rolling summary, keeping only the newest lines that fit"""
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        text = " ".join(message.content.split())
+        if len(text) > CHAT_SUMMARY_LINE_CHARS:
+            text = text[:CHAT_SUMMARY_LINE_CHARS].rsplit(" ", 1)[0] + "..."
+        speaker = "User" if message.role == "user" else "Assistant"
+        lines.append(f"{speaker}: {text}")
+
+    total = 0
+    kept = []
+    for line in reversed(lines):
+        total += estimate_tokens(line)
+        if total > CHAT_SUMMARY_TOKEN_BUDGET:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+def prepare_chat_session(user_id, emotion, session_id=None):
+    """Load (or create) a session and return (session_id, summary, history), or None if not found"""
+    with app.app_context():
+        if session_id is None:
+            session = ChatSession(user_id=user_id, emotion=emotion)
+            db.session.add(session)
+            db.session.commit()
+            return session.id, None, []
+
+        session = db.session.get(ChatSession, session_id)
+        if not session or str(session.user_id) != str(user_id):
+            return None
+
+        pending = ChatMessage.query.filter(
+            ChatMessage.session_id == session.id,
+            ChatMessage.id > session.summarized_through
+        ).order_by(ChatMessage.id.asc()).all()
+
+        # Keep the newest turns that fit the budget; everything older is compacted
+        used = 0
+        split = len(pending)
+        while split > 0 and used + pending[split - 1].token_count <= CHAT_CONTEXT_TOKEN_BUDGET:
+            used += pending[split - 1].token_count
+            split -= 1
+        overflow, recent = pending[:split], pending[split:]
+
+        if overflow:
+            session.summary = compact_into_summary(session.summary, overflow)
+            session.summarized_through = overflow[-1].id
+            db.session.commit()
+            logger.debug(f"Compacted {len(overflow)} messages in chat session {session.id}")
+
+        history = [{"role": m.role, "content": m.content} for m in recent]
+        return session.id, session.summary, history
+
+def save_chat_turn(session_id, user_message, reply=None):
+    """Persist the user's message and, when it came from the model, the assistant reply"""
+    with app.app_context():
+        session = db.session.get(ChatSession, session_id)
+        if not session:
+            return
+        turn = [("user", user_message)] + ([("assistant", reply)] if reply else [])
+        for role, content in turn:
+            db.session.add(ChatMessage(
+                session_id=session_id,
+                role=role,
+                content=content,
+                token_count=estimate_tokens(content)
+            ))
+        session.updated_at = datetime.now(timezone.utc)
+        db.session.commit()
+
+def build_chat_messages(data, summary=None, history=None):
+    """Resolve the emotion and assemble the prompt for a chat request"""
+    # Get emotion or use default (unrecognized emotions become "Unknown")
+    emotion = resolve_emotion(data)
+
+    # Prepare system prompt based on emotion
+    system_prompt = MENTAL_HEALTH_PROMPTS.get(emotion, MENTAL_HEALTH_PROMPTS["default"])
+    
+    # Add conversation context
+    messages = [{"role": "system", "content": system_prompt}]
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    
+    if history is not None:
+        # Server-side session history, already fitted to the token budget
+        messages.extend(history)
+    else:
         # Include conversation history if available
         conversation_history = data.get("conversation", [])
         messages.extend(conversation_history[-6:])  # Last 3 exchanges
-        
-        # Add current message
-        messages.append({"role": "user", "content": data["message"]})
-        
-        # Try OpenAI API first
-        if os.getenv("OPENAI_API_KEY"):
+    
+    # Add current message
+    messages.append({"role": "user", "content": data["message"]})
+    return emotion, messages
+
+def get_chat_cache_key(emotion, messages):
+    """Cache key for this prompt, or None if caching is off or it has too much history"""
+    if chat_cache is None:
+        return None
+    history_length = len(messages) - 2  # minus system prompt and current message
+    if history_length > CHAT_CACHE_MAX_HISTORY:
+        return None
+    return make_cache_key(emotion, messages)
+
+def get_fallback_lines(emotion):
+    return FALLBACK_RESPONSES.get(emotion, FALLBACK_RESPONSES["default"])
+
+def wants_stream(data, accept_header=""):
+    """Streaming is opt-in via {"stream": true} or an SSE Accept header"""
+    if data.get("stream") is True:
+        return True
+    return "text/event-stream" in accept_header
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+SSE_RESPONSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# =============================================
+# CHAT TURNS
+# =============================================
+#
+# /api/chat is served twice: by the Flask route below and natively on the
+# event loop by asgi.py. Both run the same steps from here. start_chat_turn()
+# covers everything before the model call (parsing, auth, crisis check,
+# session, prompt and cache lookup), and the ChatTurn it returns builds the
+# JSON result, every SSE frame and the session save. What is left in each
+# entrypoint is the transport and the waiting: the route calls the upstream
+# and the database directly, asgi.py awaits the async client and runs the
+# database steps on its thread pool.
+
+class ChatTurn:
+    """One chat request, from its parsed body to the final response"""
+
+    def __init__(self, data, stream, timer):
+        self.data = data
+        self.stream = stream
+        self.timer = timer
+        self.emotion = resolve_emotion(data)
+        self.messages = []
+        self.cache_key = None
+        self.session_id = None
+        # Set once the reply is known: up front for crisis messages and cache
+        # hits, otherwise after the upstream call or the fallback
+        self.reply = None
+        self.source = None
+        # Streaming state
+        self.provider = None
+        self.started = None
+        self.parts = []
+        self.usage = None
+
+    @property
+    def coalesce_key(self):
+        return make_cache_key(self.emotion, self.messages)
+
+    def needs_upstream(self):
+        return self.source is None and llm_router.available()
+
+    def completed(self, completion):
+        """Reply text of a routed completion (None if every provider's breaker is open); records usage and caches it"""
+        if completion is None:
+            return None
+        record_chat_usage(self.emotion, completion.prompt_tokens, completion.completion_tokens)
+        if completion.text and self.cache_key:
+            chat_cache.set(self.cache_key, completion.text)
+        return completion.text
+
+    def fallback(self):
+        """Switch to the predefined fallback reply and return its lines"""
+        lines = get_fallback_lines(self.emotion)
+        self.reply, self.source, self.usage = "\n".join(lines), "fallback", None
+        self.timer.mark("fallback")
+        return lines
+
+    def settle(self, reply):
+        """Take the upstream reply text, falling back when there is none"""
+        if self.source is not None:
+            return
+        if reply:
+            self.reply, self.source = reply, "model"
+        else:
+            self.fallback()
+
+    def save(self):
+        """Store the user's message and the reply in the session; fallback replies aren't stored"""
+        if self.session_id:
+            save_chat_turn(self.session_id, self.data["message"], None if self.source == "fallback" else self.reply)
+            self.timer.mark("session_save")
+
+    def _fields(self):
+        fields = {"is_fallback": self.source == "fallback"}
+        if self.source == "crisis":
+            fields["is_crisis"] = True
+        if self.source == "cached":
+            fields["cached"] = True
+        if self.session_id:
+            fields["session_id"] = self.session_id
+        return fields
+
+    def result(self):
+        """JSON body of a non-streamed reply; records the request's metrics"""
+        finish_chat_metrics(self.timer, self.emotion, self.source)
+        return {"success": True, "reply": self.reply, **self._fields()}
+
+    # Streaming
+
+    def reply_frame(self):
+        """The whole reply as one token frame (crisis responses and cache hits)"""
+        return sse_event("token", {"delta": self.reply})
+
+    def stream_request(self, provider):
+        """Start timing a stream from provider and return its create() arguments"""
+        self.provider, self.started = provider, time.monotonic()
+        return dict(
+            model=provider.model,
+            messages=self.messages,
+            timeout=llm_router.deadline,
+            stream=True,
+            stream_options={"include_usage": True},
+            **CHAT_COMPLETION_PARAMS
+        )
+
+    def stream_chunk(self, chunk):
+        """Record one upstream chunk; returns its token frame, or None if it carries no text"""
+        if chunk.usage:
+            self.usage = {
+                "prompt_tokens": chunk.usage.prompt_tokens,
+                "completion_tokens": chunk.usage.completion_tokens,
+                "total_tokens": chunk.usage.total_tokens
+            }
+            self.provider.record_usage(chunk.usage)
+            record_chat_usage(self.emotion, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+        if not (chunk.choices and chunk.choices[0].delta.content):
+            return None
+        if not self.parts:
+            self.provider.record_first_token(time.monotonic() - self.started)
+        self.parts.append(chunk.choices[0].delta.content)
+        return sse_event("token", {"delta": chunk.choices[0].delta.content})
+
+    def stream_finished(self):
+        self.provider.record(time.monotonic() - self.started, True)
+        self.timer.mark("upstream")
+        reply = "".join(self.parts).strip()
+        if reply:
+            if self.cache_key:
+                chat_cache.set(self.cache_key, reply)
+            self.reply, self.source = reply, "model"
+        else:
+            # Filtered or usage-only stream: the caller streams the fallback reply instead
+            logger.warning(f"Streaming API returned no text ({self.provider.name})")
+
+    def stream_failed(self, error):
+        self.provider.record(time.monotonic() - self.started, False, error)
+        self.timer.mark("upstream")
+        logger.warning(f"Streaming API attempt failed ({self.provider.name}): {str(error)}")
+
+    def fallback_frames(self):
+        """Frames replacing an unavailable or failed stream with the fallback reply"""
+        # Tell the client to drop any partial text, then stream the fallback line by line
+        frames = [sse_event("reset", {"reason": "upstream_error"})] if self.parts else []
+        return frames + [sse_event("token", {"delta": line + "\n"}) for line in self.fallback()]
+
+    def done_frame(self):
+        """Final SSE frame; records the request's metrics"""
+        finish_chat_metrics(self.timer, self.emotion, self.source)
+        return sse_event("done", {"success": True, **self._fields(), "usage": self.usage})
+
+def chat_failure(error):
+    """Log an unexpected chat error and return the 500 body"""
+    logger.error(f"Chat error: {str(error)}\n{traceback.format_exc()}")
+    return {
+        "success": False,
+        "message": "Chat processing failed",
+        "error": str(error) if app.debug else None
+    }
+
+def resolve_chat_session(data):
+    """(session_id, summary, history) for the request's session, or None when it doesn't use one.
+
+    Returns (context, None), or (None, (message, status)) for a bad session ID.
+    """
+    if not data.get("new_session") and data.get("session_id") is None:
+        return None, None
+    try:
+        requested_id = int(data["session_id"]) if data.get("session_id") is not None else None
+    except (TypeError, ValueError):
+        return None, ("Invalid session ID", 400)
+    session_context = prepare_chat_session(data["user_id"], data.get("emotion"), requested_id)
+    if session_context is None:
+        return None, ("Chat session not found", 404)
+    return session_context, None
+
+def start_chat_turn(data, auth_header, accept_header=""):
+    """Parse and prepare a chat request up to the upstream call.
+
+    Returns (turn, None), or (None, (message, status)) when the request is
+    rejected. Session lookups hit the database, so async callers run this on
+    a thread.
+    """
+    timer = StageTimer(CHAT_STAGE_SECONDS)
+    if not isinstance(data, dict):
+        return None, ("Request must be JSON", 400)
+    user_id, auth_error = authorize_user(data.get("user_id"), auth_header)
+    if auth_error:
+        return None, auth_error
+    if user_id is not None:
+        data["user_id"] = user_id
+    logger.debug(f"AI chat request from user: {data.get('user_id')}")
+
+    # Validate required fields
+    if not all(field in data for field in ["user_id", "message"]):
+        return None, ("User ID and message are required", 400)
+    turn = ChatTurn(data, wants_stream(data, accept_header), timer)
+    timer.mark("parse")
+
+    # Crisis language gets safety resources immediately, never an LLM round trip
+    if crisis_matcher.match(data["message"]):
+        logger.warning(f"Crisis language detected in chat from user: {data.get('user_id')}")
+        turn.reply, turn.source = CRISIS_RESPONSE, "crisis"
+    timer.mark("crisis_check")
+
+    # Server-side session: history comes from the database, not the request.
+    # Crisis turns are stored in it too; a bad session ID never holds back
+    # the crisis reply, it just goes unsaved.
+    summary = history = None
+    session_context, session_error = resolve_chat_session(data)
+    if session_error and turn.source != "crisis":
+        return None, session_error
+    if session_context:
+        turn.session_id, summary, history = session_context
+        timer.mark("session")
+    if turn.source == "crisis":
+        return turn, None
+
+    turn.emotion, turn.messages = build_chat_messages(data, summary, history)
+    turn.cache_key = get_chat_cache_key(turn.emotion, turn.messages)
+    timer.mark("prompt_assembly")
+
+    if turn.cache_key:
+        cached = chat_cache.get(turn.cache_key)
+        timer.mark("cache_lookup")
+        if cached is not None:
+            turn.reply, turn.source = cached, "cached"
+    return turn, None
+
+def request_completion(turn):
+    """Routed upstream completion for a turn; returns the reply text or None"""
+    return turn.completed(llm_router.complete(turn.messages, **CHAT_COMPLETION_PARAMS))
+
+def stream_chat_reply(turn):
+    """Yield SSE frames: token deltas as they arrive, then a final 'done' frame"""
+    if turn.source is None:
+        # Streams are not hedged; they go to the best provider whose breaker admits a call
+        provider = llm_router.pick()
+        if provider:
+            try:
+                for chunk in provider.client().chat.completions.create(**turn.stream_request(provider)):
+                    frame = turn.stream_chunk(chunk)
+                    if frame:
+                        yield frame
+                turn.stream_finished()
+            except Exception as api_error:
+                turn.stream_failed(api_error)
+        if turn.source is None:
+            yield from turn.fallback_frames()
+    else:
+        yield turn.reply_frame()
+    turn.save()
+    yield turn.done_frame()
+
+@app.route("/api/chat", methods=["POST"])
+def chat_with_ai():
+    try:
+        turn, error = start_chat_turn(request.get_json(silent=True), request.headers.get("Authorization"),
+                                      request.headers.get("Accept", ""))
+        if error:
+            return auth_error_response(error)
+
+        if turn.stream:
+            return Response(stream_with_context(stream_chat_reply(turn)),
+                            mimetype="text/event-stream", headers=SSE_RESPONSE_HEADERS)
+
+        # Try the upstream providers first, reusing pooled clients and warm connections.
+        # Identical in-flight requests share one call; while every breaker is open
+        # we skip straight to the fallback.
+        reply = None
+        if turn.needs_upstream():
             try:
-                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=messages,
-                    temperature=0.9,  # More creative responses
-                    max_tokens=250,   # Longer responses
-                    timeout=15
-                )
-                
-                if response.choices and response.choices[0].message:
-                    reply = response.choices[0].message.content.strip()
-                    return jsonify({
-                        "success": True,
-                        "reply": reply,
-                        "is_fallback": False
-                    })
-                    
+                reply = chat_singleflight.do(turn.coalesce_key, lambda: request_completion(turn))
             except Exception as api_error:
                 logger.warning(f"API attempt failed: {str(api_error)}")
-        
-        # Fallback to predefined responses
-        fallback = FALLBACK_RESPONSES.get(emotion, FALLBACK_RESPONSES["default"])
-        return jsonify({
-            "success": True,
-            "reply": "\n".join(fallback),
-            "is_fallback": True
-        })
-        
+            turn.timer.mark("upstream")
+        turn.settle(reply)
+        turn.save()
+        return jsonify(turn.result())
+
     except Exception as e:
-        logger.error(f"Chat error: {str(e)}\n{traceback.format_exc()}")
-        return jsonify({
-            "success": False,
-            "message": "Chat processing failed",
-            "error": str(e) if app.debug else None
-        }), 500
+        return jsonify(chat_failure(e)), 500
+
+@app.route("/api/chat/status", methods=["GET"])
+def chat_status():
+    """Upstream routing/breaker, cache and coalescing state for monitoring"""
+    return jsonify({
+        "success": True,
+        "upstream_configured": llm_router.available(),
+        "router": llm_router.snapshot(),
+        "cache": chat_cache.stats() if chat_cache else None,
+        "crisis": crisis_matcher.stats(),
+        "coalescing": chat_singleflight.stats(),
+        "async_coalescing": async_chat_singleflight.stats()
+    })
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text-format metrics for this worker process"""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     # Final verification
@@ -0,0 +1,184 @@
+import os
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async, ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (
+    app, llm_router, CHAT_COMPLETION_PARAMS, async_chat_singleflight, ChatTurn, start_chat_turn,
+    error_payload, chat_failure
+)
+from llm_client import close_async_llm_client
+
+logger = logging.getLogger(__name__)
+
+# =============================================
+# ASGI SERVING MODE
+# =============================================
+#
+# Run with: uvicorn asgi:application --host 0.0.0.0 --port $PORT
+#
+# /api/chat is served natively on the event loop with the async OpenAI client,
+# so a slow upstream call costs a coroutine rather than a whole worker. Every
+# other route (check-ins, journal, progress, ...) is the unchanged Flask app,
+# run on a thread pool so DB-bound requests keep their own threads.
+
+WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", 32))
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi with each request on its own thread, at most `threads` at once.
+
+    asgiref runs every WSGI call on one shared thread unless the call happens
+    inside a ThreadSensitiveContext, which gives it a thread of its own.
+    """
+
+    def __init__(self, wsgi_application, threads):
+        super().__init__(wsgi_application)
+        self._slots = asyncio.Semaphore(threads)
+
+    async def __call__(self, scope, receive, send):
+        async with self._slots, ThreadSensitiveContext():
+            await super().__call__(scope, receive, send)
+
+
+flask_application = ThreadedWsgiToAsgi(app, WSGI_THREADS)
+
+
+async def read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+def get_header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key.decode("latin-1").lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+    (b"access-control-allow-origin", b"*"),
+]
+
+
+async def send_json(send, payload, status=200, headers=None):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),
+            *((name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in (headers or {}).items()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# The chat steps themselves live in app.py (ChatTurn). Parsing, the reply
+# cache writes and the session save hit the database, so they run on the
+# thread pool; the upstream calls are awaited on the loop.
+start_chat_turn_async = sync_to_async(start_chat_turn, thread_sensitive=False)
+completed_chat_turn_async = sync_to_async(ChatTurn.completed, thread_sensitive=False)
+finish_chat_stream_async = sync_to_async(ChatTurn.stream_finished, thread_sensitive=False)
+save_chat_turn_async = sync_to_async(ChatTurn.save, thread_sensitive=False)
+
+
+async def arequest_completion(turn):
+    """app.request_completion() with the async client"""
+    completion = await llm_router.acomplete(turn.messages, **CHAT_COMPLETION_PARAMS)
+    return await completed_chat_turn_async(turn, completion)
+
+
+async def astream_chat_reply(turn):
+    """app.stream_chat_reply() with the async client"""
+    if turn.source is None:
+        provider = llm_router.pick()
+        if provider:
+            try:
+                stream = await provider.async_client().chat.completions.create(**turn.stream_request(provider))
+                async for chunk in stream:
+                    frame = turn.stream_chunk(chunk)
+                    if frame:
+                        yield frame
+                await finish_chat_stream_async(turn)
+            except Exception as api_error:
+                turn.stream_failed(api_error)
+        if turn.source is None:
+            for frame in turn.fallback_frames():
+                yield frame
+    else:
+        yield turn.reply_frame()
+    await save_chat_turn_async(turn)
+    yield turn.done_frame()
+
+
+async def chat_endpoint(scope, receive, send):
+    """POST /api/chat on the event loop, with the same contract as app.chat_with_ai"""
+    try:
+        try:
+            data = json.loads(await read_body(receive) or b"null")
+        except ValueError:
+            data = None
+        turn, error = await start_chat_turn_async(data, get_header(scope, "authorization"), get_header(scope, "accept"))
+        if error:
+            await send_json(send, *error_payload(error))
+            return
+
+        if turn.stream:
+            await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+            async for frame in astream_chat_reply(turn):
+                await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        reply = None
+        if turn.needs_upstream():
+            try:
+                reply = await async_chat_singleflight.do(turn.coalesce_key, lambda: arequest_completion(turn))
+            except Exception as api_error:
+                logger.warning(f"API attempt failed: {str(api_error)}")
+            turn.timer.mark("upstream")
+        turn.settle(reply)
+        await save_chat_turn_async(turn)
+        await send_json(send, turn.result())
+
+    except Exception as e:
+        await send_json(send, chat_failure(e), 500)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            asyncio.get_running_loop().set_default_executor(
+                ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="flask")
+            )
+            logger.info(f"ASGI mode started with {WSGI_THREADS} Flask worker threads")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_llm_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/api/chat" and scope["method"] == "POST":
+        await chat_endpoint(scope, receive, send)
+    else:
+        await flask_application(scope, receive, send)
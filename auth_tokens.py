@@ -0,0 +1,132 @@
+import os
+import time
+import logging
+import secrets
+import threading
+from collections import OrderedDict
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# =============================================
+# SIGNED ACCESS AND REFRESH TOKENS
+# =============================================
+#
+# login() issues a short-lived access token and a longer-lived refresh token,
+# both HMAC-signed with SECRET_KEY. Authenticated requests send
+# "Authorization: Bearer <access token>", which costs a signature check
+# instead of a bcrypt round, and recently verified tokens are remembered in a
+# small in-process LRU so repeat requests skip even that. Refresh tokens carry
+# the user's token_version, which only a password change bumps, so changing the
+# password revokes every outstanding refresh token. Re-hashing the same password
+# at a new cost leaves it alone and keeps other devices signed in.
+
+AUTH_TOKEN_VERIFICATIONS = REGISTRY.counter(
+    "auth_token_verifications_total", "Bearer token verifications by result", ["kind", "result"]
+)
+
+
+def load_secret_key(instance_dir):
+    """SECRET_KEY from the environment, else a random key persisted in the instance folder.
+
+    Persisting it keeps tokens valid across restarts and across workers on one host.
+    """
+    secret = os.getenv("SECRET_KEY")
+    if secret:
+        return secret
+    path = os.path.join(instance_dir, "secret_key")
+    try:
+        with open(path) as f:
+            secret = f.read().strip()
+    except FileNotFoundError:
+        secret = None
+    if not secret:
+        secret = secrets.token_urlsafe(48)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(secret)
+            logger.warning(f"SECRET_KEY not set; generated one at {path}")
+        except FileExistsError:
+            # Another worker created it first; use theirs
+            with open(path) as f:
+                secret = f.read().strip()
+    return secret
+
+
+class TokenService:
+    def __init__(self, secret_key, access_ttl=900, refresh_ttl=14 * 24 * 3600, cache_size=1024):
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.cache_size = cache_size
+        self._access = URLSafeTimedSerializer(secret_key, salt="mindwell-access")
+        self._refresh = URLSafeTimedSerializer(secret_key, salt="mindwell-refresh")
+        self._cache = OrderedDict()  # access token -> (user_id, expires_at)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, secret_key):
+        return cls(
+            secret_key,
+            access_ttl=int(os.getenv("AUTH_ACCESS_TOKEN_TTL", 900)),
+            refresh_ttl=int(os.getenv("AUTH_REFRESH_TOKEN_TTL", 14 * 24 * 3600)),
+            cache_size=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 1024)),
+        )
+
+    def issue(self, user):
+        """Token pair for a user, as returned by /login and /api/token/refresh"""
+        return {
+            "access_token": self._access.dumps({"uid": user.id}),
+            "refresh_token": self._refresh.dumps({"uid": user.id, "ver": user.token_version}),
+            "token_type": "Bearer",
+            "expires_in": self.access_ttl,
+        }
+
+    def verify_access(self, token):
+        """User ID for a valid access token, or None if it is invalid or expired"""
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(token)
+            if cached is not None:
+                if cached[1] > now:
+                    self._cache.move_to_end(token)
+                    AUTH_TOKEN_VERIFICATIONS.inc(kind="access", result="cache_hit")
+                    return cached[0]
+                del self._cache[token]
+
+        try:
+            payload, issued_at = self._access.loads(token, max_age=self.access_ttl, return_timestamp=True)
+        except SignatureExpired:
+            AUTH_TOKEN_VERIFICATIONS.inc(kind="access", result="expired")
+            return None
+        except BadSignature:
+            AUTH_TOKEN_VERIFICATIONS.inc(kind="access", result="invalid")
+            return None
+        AUTH_TOKEN_VERIFICATIONS.inc(kind="access", result="valid")
+
+        user_id = payload.get("uid")
+        with self._lock:
+            self._cache[token] = (user_id, issued_at.timestamp() + self.access_ttl)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return user_id
+
+    def verify_refresh(self, token):
+        """(user_id, token version) for a valid refresh token, or None"""
+        try:
+            payload = self._refresh.loads(token, max_age=self.refresh_ttl)
+        except SignatureExpired:
+            AUTH_TOKEN_VERIFICATIONS.inc(kind="refresh", result="expired")
+            return None
+        except BadSignature:
+            AUTH_TOKEN_VERIFICATIONS.inc(kind="refresh", result="invalid")
+            return None
+        AUTH_TOKEN_VERIFICATIONS.inc(kind="refresh", result="valid")
+        return payload.get("uid"), payload.get("ver")
+
+    def stats(self):
+        with self._lock:
+            return {"cached_tokens": len(self._cache), "cache_size": self.cache_size}
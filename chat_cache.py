@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# =============================================
+# CHAT RESPONSE CACHE
+# =============================================
+#
+# Opt-in cache in front of the completion call. Keys hash the emotion, the
+# system prompt and the whitespace/case-normalized messages, so "I feel
+# anxious" and "  i feel  ANXIOUS " share an entry. Two backends:
+#   memory - per-process LRU with per-entry TTL (default)
+#   sqlite - local file shared by every gunicorn worker on the host
+
+
+def normalize_text(text):
+    return " ".join(str(text).split()).casefold()
+
+
+def make_cache_key(emotion, messages):
+    """Stable key for an assembled prompt (system prompt + trimmed history + message)"""
+    normalized = [
+        [message.get("role", ""), normalize_text(message.get("content", ""))]
+        for message in messages
+    ]
+    payload = json.dumps([emotion, normalized], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class LRUTTLCache:
+    """Bounded in-memory LRU cache where every entry also expires after ``ttl`` seconds"""
+
+    backend = "memory"
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = _CacheStats()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._stats.expirations += 1
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.backend, "size": len(self._entries),
+                    "max_entries": self.max_entries, "ttl": self.ttl, **self._stats.as_dict()}
+
+
+class SqliteTTLCache:
+    """LRU+TTL cache stored in a local SQLite file so all workers on a host share it.
+
+    Hit/miss counters are per process; size and eviction are global.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path, max_entries=10000, ttl=3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._stats = _CacheStats()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_cache_last_used ON chat_cache (last_used)")
+
+    def _connect(self):
+        # Short-lived connections keep this safe across threads and forks
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def get(self, key):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM chat_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    outcome = "miss"
+                elif row[1] <= now:
+                    conn.execute("DELETE FROM chat_cache WHERE key = ?", (key,))
+                    outcome = "expired"
+                else:
+                    conn.execute("UPDATE chat_cache SET last_used = ? WHERE key = ?", (now, key))
+                    outcome = "hit"
+        except sqlite3.Error as e:
+            logger.warning(f"Chat cache read failed: {str(e)}")
+            row, outcome = None, "miss"
+
+        with self._lock:
+            if outcome == "hit":
+                self._stats.hits += 1
+                return row[0]
+            if outcome == "expired":
+                self._stats.expirations += 1
+            self._stats.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO chat_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now)
+                )
+                overflow = conn.execute("SELECT COUNT(*) FROM chat_cache").fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    conn.execute(
+                        "DELETE FROM chat_cache WHERE key IN "
+                        "(SELECT key FROM chat_cache ORDER BY last_used LIMIT ?)", (overflow,)
+                    )
+                    with self._lock:
+                        self._stats.evictions += overflow
+        except sqlite3.Error as e:
+            logger.warning(f"Chat cache write failed: {str(e)}")
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chat_cache")
+
+    def stats(self):
+        try:
+            with self._connect() as conn:
+                size = conn.execute("SELECT COUNT(*) FROM chat_cache").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        with self._lock:
+            return {"backend": self.backend, "size": size,
+                    "max_entries": self.max_entries, "ttl": self.ttl, **self._stats.as_dict()}
+
+
+def create_chat_cache(data_dir):
+    """Build the chat cache from CHAT_CACHE_* settings, or return None when disabled"""
+    if os.getenv("CHAT_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+
+    ttl = float(os.getenv("CHAT_CACHE_TTL", 3600))
+    max_entries = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", 1024))
+    backend = os.getenv("CHAT_CACHE_BACKEND", "memory").lower()
+
+    if backend == "sqlite":
+        path = os.getenv("CHAT_CACHE_PATH", os.path.join(data_dir, "chat_cache.db"))
+        cache = SqliteTTLCache(path, max_entries=max_entries, ttl=ttl)
+    else:
+        cache = LRUTTLCache(max_entries=max_entries, ttl=ttl)
+
+    logger.info(f"Chat response cache enabled ({cache.backend}, max_entries={max_entries}, ttl={ttl}s)")
+    return cache
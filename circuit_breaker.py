@@ -0,0 +1,160 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Thread-safe circuit breaker driven by failure rate and slow-call rate.
+
+    Outcomes are kept in a sliding time window. Once at least ``min_calls``
+    outcomes are in the window and either the failure rate or the slow-call
+    rate crosses its threshold, the breaker opens and callers are refused for
+    ``open_seconds``. It then lets ``half_open_max_calls`` probes through; a
+    healthy probe closes it again, a failed or slow one reopens it.
+    """
+
+    def __init__(self, name, failure_rate_threshold=0.5, slow_call_seconds=8.0,
+                 slow_call_rate_threshold=0.8, min_calls=5, window_seconds=60.0,
+                 open_seconds=30.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._outcomes = deque()  # (timestamp, failed, slow)
+        self._opened_at = None
+        self._probes = deque()  # start times of in-flight half-open probes
+        self._rejected = 0
+        self._transitions = 0
+
+    @classmethod
+    def from_env(cls, name, prefix):
+        """Build a breaker from ``<prefix>_*`` environment variables"""
+        return cls(
+            name,
+            failure_rate_threshold=float(os.getenv(f"{prefix}_FAILURE_RATE", 0.5)),
+            slow_call_seconds=float(os.getenv(f"{prefix}_SLOW_CALL_SECONDS", 8)),
+            slow_call_rate_threshold=float(os.getenv(f"{prefix}_SLOW_CALL_RATE", 0.8)),
+            min_calls=int(os.getenv(f"{prefix}_MIN_CALLS", 5)),
+            window_seconds=float(os.getenv(f"{prefix}_WINDOW_SECONDS", 60)),
+            open_seconds=float(os.getenv(f"{prefix}_OPEN_SECONDS", 30)),
+            half_open_max_calls=int(os.getenv(f"{prefix}_HALF_OPEN_CALLS", 1)),
+        )
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def allow_request(self):
+        """Return True if a call may go upstream; callers must then record its outcome"""
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN:
+                # A probe whose caller vanished without recording (e.g. a client
+                # disconnect mid-stream) stops counting after open_seconds
+                while self._probes and now - self._probes[0] > self.open_seconds:
+                    self._probes.popleft()
+                if len(self._probes) < self.half_open_max_calls:
+                    self._probes.append(now)
+                    return True
+            self._rejected += 1
+            return False
+
+    def record_success(self, latency):
+        self._record(failed=False, latency=latency)
+
+    def record_failure(self, latency):
+        self._record(failed=True, latency=latency)
+
+    def snapshot(self):
+        """Current state and window statistics, for monitoring endpoints"""
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            calls, failure_rate, slow_rate = self._rates()
+            return {
+                "name": self.name,
+                "state": self._state,
+                "window_calls": calls,
+                "failure_rate": round(failure_rate, 3),
+                "slow_call_rate": round(slow_rate, 3),
+                "rejected_calls": self._rejected,
+                "state_transitions": self._transitions,
+                "retry_after_seconds": (
+                    round(max(0.0, self.open_seconds - (now - self._opened_at)), 1)
+                    if self._state == OPEN else 0
+                ),
+            }
+
+    def _record(self, failed, latency):
+        now = time.monotonic()
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            self._refresh(now)
+            if self._state == HALF_OPEN:
+                if self._probes:
+                    self._probes.popleft()
+                if failed or slow:
+                    self._transition(OPEN, now)
+                else:
+                    self._transition(CLOSED, now)
+                return
+            if self._state == OPEN:
+                # A call admitted before the breaker tripped; nothing to learn
+                return
+
+            self._outcomes.append((now, failed, slow))
+            self._prune(now)
+            calls, failure_rate, slow_rate = self._rates()
+            if calls >= self.min_calls and (
+                failure_rate >= self.failure_rate_threshold
+                or slow_rate >= self.slow_call_rate_threshold
+            ):
+                self._transition(OPEN, now)
+
+    def _refresh(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN, now)
+
+    def _prune(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _rates(self):
+        calls = len(self._outcomes)
+        if not calls:
+            return 0, 0.0, 0.0
+        failures = sum(1 for _, failed, _ in self._outcomes if failed)
+        slow = sum(1 for _, _, is_slow in self._outcomes if is_slow)
+        return calls, failures / calls, slow / calls
+
+    def _transition(self, state, now):
+        if state == self._state:
+            return
+        logger.warning(f"Circuit breaker '{self.name}': {self._state} -> {state}")
+        self._state = state
+        self._transitions += 1
+        self._probes.clear()
+        if state == OPEN:
+            self._opened_at = now
+        elif state == CLOSED:
+            self._outcomes.clear()
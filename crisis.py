@@ -0,0 +1,127 @@
+import os
+import re
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# =============================================
+# CRISIS LANGUAGE DETECTION
+# =============================================
+#
+# Every chat message is checked against a maintained phrase list before any
+# upstream call. All phrases are compiled into one case-insensitive
+# alternation, so a check is a single regex scan over the message. The list
+# file is re-read when its modification time changes (checked at most every
+# CRISIS_PHRASES_RELOAD_SECONDS), so it can be edited without a restart.
+
+CRISIS_RESPONSE = "\n".join([
+    "I'm really sorry you're going through this, and I'm glad you reached out. "
+    "You deserve support from a real person right now.",
+    "• If you are in immediate danger, call your local emergency number (911 in the US, 999 in the UK, 112 in the EU).",
+    "• US: call or text 988 (Suicide & Crisis Lifeline), or text HOME to 741741.",
+    "• UK & Ireland: call Samaritans on 116 123.",
+    "• Elsewhere: find a free, confidential helpline at https://findahelpline.com.",
+    "If you can, reach out to someone you trust and let them know how you're feeling. "
+    "I'm here to keep talking with you too."
+])
+
+_APOSTROPHES = str.maketrans({"’": "'", "‘": "'", "ʼ": "'"})
+
+
+def load_phrases(path):
+    with open(path, encoding="utf-8") as f:
+        return [
+            line.strip().casefold()
+            for line in f
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+def compile_phrases(phrases):
+    """One alternation for all phrases; longest first so overlapping phrases report the longer match"""
+    if not phrases:
+        return None
+    alternatives = [
+        r"\s+".join(re.escape(word) for word in phrase.split())
+        for phrase in sorted(set(phrases), key=len, reverse=True)
+    ]
+    return re.compile(r"(?<!\w)(?:" + "|".join(alternatives) + r")(?!\w)", re.IGNORECASE)
+
+
+class CrisisMatcher:
+    def __init__(self, path, reload_interval=5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._pattern = None
+        self._phrase_count = 0
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._checks = 0
+        self._matches = 0
+        self._loaded_at = None
+        self.reload()
+
+    @classmethod
+    def from_env(cls, default_path):
+        return cls(
+            os.getenv("CRISIS_PHRASES_PATH", default_path),
+            reload_interval=float(os.getenv("CRISIS_PHRASES_RELOAD_SECONDS", 5)),
+        )
+
+    def reload(self):
+        """Re-read and recompile the phrase list; keeps the previous list if the file is unreadable"""
+        try:
+            mtime = os.path.getmtime(self.path)
+            phrases = load_phrases(self.path)
+            pattern = compile_phrases(phrases)
+        except (OSError, re.error) as e:
+            logger.error(f"Failed to load crisis phrases from {self.path}: {str(e)}")
+            return False
+
+        with self._lock:
+            # Readers use whatever pattern reference they grabbed; the swap is atomic
+            self._pattern = pattern
+            self._phrase_count = len(set(phrases))
+            self._mtime = mtime
+            self._loaded_at = time.time()
+        logger.info(f"Loaded {self._phrase_count} crisis phrases from {self.path}")
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        try:
+            changed = os.path.getmtime(self.path) != self._mtime
+        except OSError:
+            return
+        if changed:
+            self.reload()
+
+    def match(self, text):
+        """Return the matched crisis phrase, or None"""
+        if self.reload_interval > 0:
+            self._maybe_reload()
+        pattern = self._pattern
+        found = pattern.search(str(text).translate(_APOSTROPHES)) if pattern else None
+        with self._lock:
+            self._checks += 1
+            if found:
+                self._matches += 1
+        return found.group(0) if found else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "phrases": self._phrase_count,
+                "checks": self._checks,
+                "matches": self._matches,
+                "loaded_at": (
+                    time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self._loaded_at))
+                    if self._loaded_at else None
+                ),
+            }
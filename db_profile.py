@@ -0,0 +1,162 @@
+import os
+import re
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+# =============================================
+# DATABASE URL AND ENGINE PROFILES
+# =============================================
+#
+# DATABASE_URL picks the database; without it the app uses the SQLite file in
+# instance/. Heroku-style postgres:// URLs are accepted and, like other URLs
+# without a driver, use psycopg2. Each backend gets its
+# own engine options below. The pool settings (DB_POOL_SIZE, DB_MAX_OVERFLOW,
+# DB_POOL_TIMEOUT) apply to both.
+#
+# PostgreSQL connections pre-ping before reuse (DB_POOL_PRE_PING) and are
+# recycled after DB_POOL_RECYCLE seconds. They run with a server-side
+# statement_timeout (DB_STATEMENT_TIMEOUT_MS, 0 disables), so a runaway query
+# cannot hold a pooled connection forever. Sessions use timezone=UTC: the
+# models store naive UTC timestamps, and psycopg2 would otherwise convert the
+# app's aware datetimes to the server's zone.
+
+
+def database_url_from_env(default_sqlite_path):
+    url = os.getenv("DATABASE_URL", "").strip()
+    if not url:
+        return f"sqlite:///{default_sqlite_path}"
+    # Driver-less URLs would load psycopg 3 on SQLAlchemy 2.1; requirements ship psycopg2
+    for scheme in ("postgres://", "postgresql://"):
+        if url.startswith(scheme):
+            url = "postgresql+psycopg2://" + url[len(scheme):]
+    return url
+
+
+def backend_name(url):
+    return make_url(url).get_backend_name()
+
+
+def safe_url(url):
+    """URL for logs, with the password masked"""
+    return make_url(url).render_as_string(hide_password=True)
+
+
+def postgres_engine_options():
+    """SQLALCHEMY_ENGINE_OPTIONS for PostgreSQL"""
+    statement_timeout = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))
+    options = "-c timezone=UTC"
+    if statement_timeout > 0:
+        options += f" -c statement_timeout={statement_timeout}"
+    return {
+        **pool_options_from_env(),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        "connect_args": {"options": options, "application_name": os.getenv("DB_APPLICATION_NAME", "mindwell")},
+    }
+
+
+def active_postgres_settings(engine):
+    with engine.connect() as connection:
+        return {
+            name: connection.exec_driver_sql(f"SHOW {name}").scalar()
+            for name in ("server_version", "statement_timeout", "timezone")
+        }
+
+
+# =============================================
+# SQLITE ENGINE PROFILE
+# =============================================
+#
+# SQLite's defaults suit a single process, not several request threads and
+# gunicorn workers. With a rollback journal, readers block behind every
+# writer. With no busy timeout, a second writer fails immediately with
+# "database is locked". These pragmas are applied to every new connection the
+# pool opens:
+#
+#   busy_timeout  wait this many ms for a lock instead of failing
+#   journal_mode  WAL: readers never block writers or each other (persistent)
+#   synchronous   NORMAL is durable at checkpoints in WAL mode, and fsyncs far less
+#   foreign_keys  enforce the ForeignKey constraints declared on the models
+#   cache_size    page cache per connection (negative = KiB)
+#   mmap_size     read through a memory map instead of read() calls
+#   temp_store    sorts and temp indexes in memory
+#
+# Each one can be overridden with SQLITE_<NAME> (e.g. SQLITE_SYNCHRONOUS=FULL);
+# an empty value leaves SQLite's default. The pool keeps DB_POOL_SIZE
+# connections open for reuse, so the pragmas run once per connection, not once
+# per request.
+
+SQLITE_PRAGMA_DEFAULTS = {
+    "busy_timeout": "5000",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "cache_size": "-20000",
+    "mmap_size": "268435456",
+    "temp_store": "MEMORY",
+}
+
+_PRAGMA_VALUE = re.compile(r"^-?[A-Za-z0-9_]+$")
+
+# PRAGMA reads return numbers for these; show the names that were configured
+_PRAGMA_NAMES = {
+    "synchronous": {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"},
+    "temp_store": {0: "DEFAULT", 1: "FILE", 2: "MEMORY"},
+    "foreign_keys": {0: "OFF", 1: "ON"},
+}
+
+
+def sqlite_pragmas_from_env():
+    pragmas = {}
+    for name, default in SQLITE_PRAGMA_DEFAULTS.items():
+        value = os.getenv(f"SQLITE_{name.upper()}", default).strip()
+        if not value:
+            continue
+        if not _PRAGMA_VALUE.match(value):
+            raise ValueError(f"Invalid value for SQLITE_{name.upper()}: {value!r}")
+        pragmas[name] = value
+    return pragmas
+
+
+def pool_options_from_env():
+    """SQLAlchemy pool settings shared by every database backend"""
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+    }
+
+
+def sqlite_engine_options(pragmas):
+    """SQLALCHEMY_ENGINE_OPTIONS for a file-based SQLite database"""
+    busy_ms = int(pragmas.get("busy_timeout", 5000))
+    return {
+        **pool_options_from_env(),
+        # Pooled connections are handed to whichever request thread checks them out
+        "connect_args": {"check_same_thread": False, "timeout": busy_ms / 1000},
+    }
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def active_sqlite_pragmas(engine, names=SQLITE_PRAGMA_DEFAULTS):
+    """The values a pooled connection actually runs with, for startup logging"""
+    active = {}
+    with engine.connect() as connection:
+        for name in names:
+            value = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            active[name] = _PRAGMA_NAMES.get(name, {}).get(value, value)
+    return active
@@ -0,0 +1,57 @@
+import numpy as np
+
+# =============================================
+# CHART DOWNSAMPLING (LARGEST-TRIANGLE-THREE-BUCKETS)
+# =============================================
+#
+# Charts can draw a few hundred points, and a dense check-in history has far
+# more. LTTB (Steinarsson, 2013) keeps the first and last points and splits
+# the rest into threshold - 2 equal-count buckets. From each bucket it keeps
+# the point that forms the largest triangle with the point kept from the
+# previous bucket and the average of the next bucket. Peaks and dips survive,
+# which a plain average or every-nth-point sample would flatten or skip.
+#
+# Each bucket's choice depends on the previous one, so the walk over buckets
+# stays a loop. The work inside it is vectorized: bucket averages come from
+# one np.add.reduceat, and each step is a single argmax over its bucket's
+# triangle areas. x must be ascending: numbers, or datetimes/dates, which
+# are placed on a microsecond axis.
+
+
+def lttb(x, y, threshold):
+    """Indices of the points to keep, with the [first, last] source index each one stands for
+
+    Returns three integer arrays (kept, first, last). With threshold >= len(x)
+    every point is kept and stands for itself.
+    """
+    x = np.asarray(x)
+    if x.dtype == object or np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[us]").astype(np.int64)
+    x = x.astype(float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        every = np.arange(n)
+        return every, every, every
+
+    # Bucket i covers source points edges[i] .. edges[i + 1] - 1; the first and last points are their own buckets
+    edges = np.empty(threshold + 1, dtype=np.intp)
+    edges[0], edges[-1] = 0, n
+    edges[1:-1] = 1 + np.arange(threshold - 1) * (n - 2) // (threshold - 2)  # integer maths: no rounding drift
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x, edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y, edges[:-1]) / sizes
+
+    kept = np.empty(threshold, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    anchor = 0
+    for bucket in range(1, threshold - 1):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Twice the triangle area (anchor, candidate, next bucket's average); the constant factor doesn't change the argmax
+        areas = np.abs(
+            (x[anchor] - mean_x[bucket + 1]) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (mean_y[bucket + 1] - y[anchor])
+        )
+        anchor = start + int(np.argmax(areas))
+        kept[bucket] = anchor
+    return kept, edges[:-1], edges[1:] - 1
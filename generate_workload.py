@@ -0,0 +1,216 @@
+import math
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+
+from app import (app, db, User, CheckIn, JournalEntry, ProgressMetric, Feedback,
+                 VALID_MOODS, MOOD_VALUES, password_hasher, rebuild_mood_rollups)
+
+# =============================================
+# SYNTHETIC WORKLOAD GENERATOR
+# =============================================
+#
+# Fills users, checkins, progress_metrics, journal_entries and feedback with
+# realistic-looking data so performance work can be measured at production
+# volumes locally:
+#
+#   python generate_workload.py --users 1000 --days 90
+#   python generate_workload.py --users 30000 --days 365 --seed 7   # ~10M rows
+#
+# Every user gets a signup day, an activity level (some users check in a lot,
+# most a little) and a personal mood tendency. Each day, each active user gets
+# a Poisson number of check-ins, journal entries and feedback notes. Check-in
+# moods come from MOOD_VALUES, weighted by --mood-bias plus the user's own
+# tendency. Every check-in also writes the "mood" progress metric, as
+# create_checkin() does.
+#
+# Rows are generated day by day across all users, so ids grow with time and
+# one user's rows are spread through the table as they are in production.
+# Output depends only on the arguments: the same seed and options always
+# produce the same rows (and the same ids, on an empty database), apart from
+# the bcrypt salt in the shared password hash. --end-date is fixed by default
+# for that reason. Rows are written with executemany INSERTs, --batch-size
+# rows per transaction. All users share one password (--password), hashed once.
+# The mood rollups for the generated users are rebuilt at the end.
+
+VOCABULARY = (
+    "today felt long and I kept thinking about work family sleep friends walk "
+    "the weather was grey but I managed to get outside for a while talked with "
+    "my sister about plans felt anxious before the meeting then calmer after "
+    "breathing exercises helped a little tired again could not focus grateful "
+    "for small things music coffee cooking dinner reading tomorrow will be better "
+    "trying to be patient with myself noticed my thoughts racing at night"
+).split()
+TITLES = ("Morning thoughts", "Evening reflection", "A hard day", "Small wins", "Checking in",
+          "Things I'm grateful for", "Notes to self", "After therapy", "Weekend", "Untitled")
+FEEDBACK = ("The suggestions helped", "Not what I needed today", "The breathing exercise was useful",
+            "Responses felt repetitive", "Thank you, this made me feel heard", "Too generic")
+
+
+def poisson(rng, mean):
+    """Knuth's method; fine for the small per-day means used here"""
+    if mean <= 0:
+        return 0
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def words(rng, mean):
+    # Log-normal lengths: most entries are short, a few are very long
+    sigma = 0.6
+    count = max(1, int(rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)))
+    return " ".join(rng.choices(VOCABULARY, k=count)).capitalize() + "."
+
+
+def clamp(value, low=1, high=5):
+    return max(low, min(high, int(round(value))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic workload")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=90, help="length of the simulated history")
+    parser.add_argument("--end-date", default="2025-01-01", help="day after the last simulated day (YYYY-MM-DD)")
+    parser.add_argument("--checkins-per-day", type=float, default=0.8, help="mean per active user per day")
+    parser.add_argument("--journals-per-day", type=float, default=0.25, help="mean per active user per day")
+    parser.add_argument("--journal-words", type=int, default=120, help="mean journal entry length in words")
+    parser.add_argument("--feedback-per-day", type=float, default=0.02, help="mean per active user per day")
+    parser.add_argument("--mood-bias", type=float, default=0.0,
+                        help="skews the mood mix: <0 towards low MOOD_VALUES, >0 towards high, 0 even")
+    parser.add_argument("--mood-spread", type=float, default=0.5, help="how much users' own mood tendencies differ")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--password", default="Password123", help="password for every generated user")
+    parser.add_argument("--batch-size", type=int, default=20000, help="rows per transaction")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    end = datetime.strptime(args.end_date, "%Y-%m-%d")
+    start = end - timedelta(days=args.days)
+    domain = f"seed{args.seed}.example.test"
+
+    # create_checkin() only accepts moods that have a MOOD_VALUES entry
+    checkin_moods = [mood for mood in VALID_MOODS if mood in MOOD_VALUES]
+    feedback_moods = VALID_MOODS
+
+    with app.app_context():
+        if db.session.scalar(db.select(func.count()).select_from(User).where(User.email.like(f"%@{domain}"))):
+            raise SystemExit(f"❌ Users for seed {args.seed} already exist (*@{domain}); use another --seed")
+
+        started = time.perf_counter()
+        password_hash = password_hasher.hash(args.password)
+        print(f"🌱 Seed {args.seed}: {args.users} users over {args.days} days ending {args.end_date}")
+
+        # Users: signup day, activity level and mood tendency
+        profiles = []
+        for i in range(args.users):
+            signup_day = int(rng.random() ** 2 * args.days * 0.8)  # more early signups
+            profiles.append({
+                "signup_day": signup_day,
+                "activity": rng.gammavariate(2.0, 0.5),  # mean 1, long tail of heavy users
+                "tilt": args.mood_bias + rng.gauss(0, args.mood_spread),
+                "user": {
+                    "first_name": rng.choice(("Alex", "Sam", "Jordan", "Taylor", "Riley", "Casey", "Morgan")),
+                    "last_name": f"Tester{i}",
+                    "email": f"user{i}@{domain}",
+                    "password_hash": password_hash,
+                    "created_at": start + timedelta(days=signup_day, seconds=rng.randrange(86400)),
+                },
+            })
+
+        user_insert = insert(User).returning(User.id, sort_by_parameter_order=True)
+        for offset in range(0, len(profiles), args.batch_size):
+            chunk = profiles[offset:offset + args.batch_size]
+            ids = db.session.scalars(user_insert, [profile["user"] for profile in chunk]).all()
+            for profile, user_id in zip(chunk, ids):
+                profile["id"] = user_id
+            db.session.commit()
+        print(f"✅ {len(profiles)} users")
+
+        tables = {
+            "checkins": CheckIn.__table__,
+            "progress_metrics": ProgressMetric.__table__,
+            "journal_entries": JournalEntry.__table__,
+            "feedback": Feedback.__table__,
+        }
+        buffers = {name: [] for name in tables}
+        written = {name: 0 for name in tables}
+
+        def flush():
+            for name, rows in buffers.items():
+                if rows:
+                    rows.sort(key=lambda row: row["date" if "date" in row else "created_at"])
+                    db.session.execute(insert(tables[name]), rows)
+                    written[name] += len(rows)
+                    rows.clear()
+            db.session.commit()
+
+        def mood_weights(tilt):
+            return [math.exp(tilt * (MOOD_VALUES[mood] - 3)) for mood in checkin_moods]
+
+        for profile in profiles:
+            profile["weights"] = mood_weights(profile["tilt"])
+
+        for day in range(args.days):
+            day_start = start + timedelta(days=day)
+            for profile in profiles:
+                if day < profile["signup_day"]:
+                    continue
+                user_id, activity = profile["id"], profile["activity"]
+
+                for _ in range(poisson(rng, args.checkins_per_day * activity)):
+                    at = day_start + timedelta(seconds=rng.randrange(86400))
+                    mood = rng.choices(checkin_moods, profile["weights"])[0]
+                    value = MOOD_VALUES[mood]
+                    buffers["checkins"].append({
+                        "user_id": user_id, "date": at, "mood": mood,
+                        "energy_level": clamp(rng.gauss(value, 0.8)),
+                        "anxiety_level": clamp(rng.gauss(6 - value, 0.8)),
+                        "notes": words(rng, 12) if rng.random() < 0.3 else "",
+                    })
+                    buffers["progress_metrics"].append({
+                        "user_id": user_id, "date": at, "metric_type": "mood", "value": float(value),
+                    })
+
+                for _ in range(poisson(rng, args.journals_per_day * activity)):
+                    buffers["journal_entries"].append({
+                        "user_id": user_id,
+                        "date": day_start + timedelta(seconds=rng.randrange(86400)),
+                        "title": rng.choice(TITLES),
+                        "content": words(rng, args.journal_words),
+                        "mood": rng.choices(checkin_moods, profile["weights"])[0] if rng.random() < 0.7 else None,
+                        "is_private": rng.random() < 0.8,
+                    })
+
+                for _ in range(poisson(rng, args.feedback_per_day * activity)):
+                    buffers["feedback"].append({
+                        "user_id": user_id,
+                        "emotion": rng.choice(feedback_moods),
+                        "text": rng.choice(FEEDBACK),
+                        "created_at": day_start + timedelta(seconds=rng.randrange(86400)),
+                        "is_processed": rng.random() < 0.5,
+                    })
+
+            if sum(len(rows) for rows in buffers.values()) >= args.batch_size or day == args.days - 1:
+                flush()
+                total = sum(written.values())
+                print(f"📈 Day {day + 1}/{args.days}: {total} rows ({total / (time.perf_counter() - started):.0f} rows/s)")
+
+        # Metrics were inserted directly, so create_checkin() never saw them
+        rollup_started = time.perf_counter()
+        rollups = rebuild_mood_rollups([profile["id"] for profile in profiles])
+        print(f"📊 {rollups} mood rollups in {time.perf_counter() - rollup_started:.1f}s")
+
+        elapsed = time.perf_counter() - started
+        total = len(profiles) + sum(written.values())
+        print(f"🏁 {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)")
+        print(f"   users {len(profiles)}, " + ", ".join(f"{name} {count}" for name, count in written.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import os
+import re
+import csv
+import sys
+import json
+import time
+import argparse
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db, User, password_hasher
+from password_hasher import PasswordHasher, hash_rounds
+
+# =============================================
+# BULK USER IMPORT
+# =============================================
+#
+# Streams users from CSV (with a header row) or NDJSON into the users table:
+#
+#   python import_users.py users.csv
+#   python import_users.py users.ndjson --batch-size 2000 --workers 8
+#
+# Each record needs first_name, last_name, email and either password
+# (hashed here) or password_hash (an existing bcrypt hash, kept as-is, for
+# migrations). Batches of passwords are hashed across the password hashing
+# process pool while the previous batch is being inserted, and every batch is
+# one transaction. Emails that already exist (case-insensitively) are skipped,
+# so re-running an import is safe.
+#
+# After each committed batch the number of input records consumed is written
+# to a checkpoint file (<input>.checkpoint.json by default). If the import
+# stops, running the same command again resumes after the last committed
+# batch; --restart ignores the checkpoint. It is removed once the import
+# finishes.
+
+EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+REQUIRED = ("first_name", "last_name", "email")
+MAX_REPORTED_INVALID = 20
+
+
+def read_records(path, fmt):
+    """Yield (record number, dict) from a CSV or NDJSON file, one record at a time"""
+    stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(stream), start=1):
+                yield number, row
+        else:
+            number = 0
+            for line in stream:
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield number, record if isinstance(record, dict) else None
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def validate(record):
+    """(user values, password or None) for a valid record, else (None, reason)"""
+    if record is None:
+        return None, "not a JSON object"
+    values = {field: str(record.get(field) or "").strip() for field in REQUIRED}
+    missing = [field for field in REQUIRED if not values[field]]
+    if missing:
+        return None, f"missing {', '.join(missing)}"
+    if not EMAIL_RE.match(values["email"]):
+        return None, "invalid email"
+    if len(values["first_name"]) > 50 or len(values["last_name"]) > 50 or len(values["email"]) > 120:
+        return None, "field too long"
+
+    password_hash = record.get("password_hash")
+    if password_hash:
+        if hash_rounds(password_hash) is None:
+            return None, "password_hash is not a bcrypt hash"
+        values["password_hash"] = password_hash
+        return values, None
+    password = record.get("password")
+    if not password or len(str(password)) < 6:
+        return None, "password must be at least 6 characters"
+    return values, str(password)
+
+
+def read_batches(records, batch_size, report_invalid):
+    """Group valid records into (last record number, users, passwords, invalid count) batches
+
+    passwords[i] is None when users[i] came with a password_hash.
+    """
+    users, passwords, invalid, consumed = [], [], 0, None
+    for number, record in records:
+        consumed = number
+        values, password = validate(record)
+        if values is None:
+            invalid += 1
+            report_invalid(number, password)
+            continue
+        users.append(values)
+        passwords.append(password)
+        if len(users) >= batch_size:
+            yield consumed, users, passwords, invalid
+            users, passwords, invalid, consumed = [], [], 0, None
+    if consumed is not None:
+        yield consumed, users, passwords, invalid
+
+
+def load_checkpoint(path, source):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    if checkpoint.get("source") != source:
+        raise SystemExit(f"❌ Checkpoint {path} belongs to {checkpoint.get('source')}; use --restart or --checkpoint")
+    return checkpoint
+
+
+def save_checkpoint(path, state):
+    # Written to a temp file and renamed so a crash never leaves a torn checkpoint
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import users from CSV or NDJSON")
+    parser.add_argument("path", help="input file, or - for stdin (requires --format)")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=1000, help="records per transaction (default 1000)")
+    parser.add_argument("--workers", type=int, help="hashing processes (default: PASSWORD_HASH_WORKERS or CPU count)")
+    parser.add_argument("--rounds", type=int, help="bcrypt cost (default: the app's current cost)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <input>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        if args.path == "-":
+            parser.error("--format is required when reading from stdin")
+        fmt = "csv" if args.path.lower().endswith(".csv") else "ndjson"
+    source = args.path if args.path == "-" else os.path.abspath(args.path)
+    checkpoint_path = args.checkpoint or (None if args.path == "-" else f"{args.path}.checkpoint.json")
+
+    hasher = PasswordHasher(
+        workers=args.workers if args.workers is not None else password_hasher.workers,
+        rounds=args.rounds or password_hasher.rounds,
+        prefix=password_hasher.prefix,
+        handle_long_passwords=password_hasher.handle_long_passwords,
+        start_method=password_hasher.start_method,
+    )
+
+    state = {"source": source, "records": 0, "imported": 0, "skipped": 0, "invalid": 0}
+    if checkpoint_path and not args.restart:
+        checkpoint = load_checkpoint(checkpoint_path, source)
+        if checkpoint:
+            state.update(checkpoint)
+            print(f"↪️ Resuming after record {state['records']} ({state['imported']} already imported)")
+    resume_after = state["records"]
+
+    reported = []
+
+    def report_invalid(number, reason):
+        if len(reported) < MAX_REPORTED_INVALID:
+            print(f"⚠️ Record {number}: {reason}")
+        elif len(reported) == MAX_REPORTED_INVALID:
+            print("⚠️ Further invalid records are counted but not shown")
+        reported.append(number)
+
+    def existing_emails(users):
+        keys = {user["email"].lower() for user in users}
+        return set(db.session.scalars(select(func.lower(User.email)).where(func.lower(User.email).in_(keys))))
+
+    def insert_batch(users):
+        """Insert users whose email is new; returns (inserted, skipped)"""
+        for _ in range(3):
+            taken = existing_emails(users)
+            rows = []
+            for user in users:
+                key = user["email"].lower()
+                if key not in taken:
+                    taken.add(key)
+                    rows.append(user)
+            try:
+                if rows:
+                    db.session.execute(insert(User), rows)
+                db.session.commit()
+                return len(rows), len(users) - len(rows)
+            except IntegrityError:
+                # Someone registered one of these emails since we looked; look again
+                db.session.rollback()
+        raise RuntimeError("batch kept conflicting with concurrent registrations")
+
+    def commit(batch, hashes):
+        consumed, users, passwords, invalid = batch
+        t0 = time.perf_counter()
+        for user, password in zip(users, passwords):
+            if password is not None:
+                user["password_hash"] = next(hashes)
+        t1 = time.perf_counter()
+        inserted, skipped = insert_batch(users)
+        t2 = time.perf_counter()
+        timings["hash_wait"] += t1 - t0
+        timings["db"] += t2 - t1
+
+        state["records"] = consumed
+        state["imported"] += inserted
+        state["skipped"] += skipped
+        state["invalid"] += invalid
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, state)
+        timings["records"] += len(users)
+        rate = timings["records"] / (t2 - started)
+        print(f"✅ Record {consumed}: {state['imported']} imported, {state['skipped']} existing, "
+              f"{state['invalid']} invalid ({rate:.0f} records/s)")
+
+    records = ((number, record) for number, record in read_records(args.path, fmt) if number > resume_after)
+    batches = read_batches(records, args.batch_size, report_invalid)
+    timings = {"hash_wait": 0.0, "db": 0.0, "records": 0}
+    print(f"📥 Importing {args.path} ({fmt}) with bcrypt cost {hasher.rounds} on {hasher.workers} hashing worker(s)")
+
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            # One batch ahead: the pool hashes batch N+1 while batch N is inserted
+            pending = None
+            for batch in batches:
+                hashes = hasher.hash_many([password for password in batch[2] if password is not None])
+                if pending:
+                    commit(*pending)
+                pending = (batch, hashes)
+            if pending:
+                commit(*pending)
+        except KeyboardInterrupt:
+            hasher.shutdown(wait=False)
+            print(f"⏸️ Interrupted; run the same command again to resume after record {state['records']}")
+            sys.exit(130)
+        hasher.shutdown()
+
+    elapsed = time.perf_counter() - started
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"🏁 Done in {elapsed:.1f}s: {state['imported']} imported, {state['skipped']} already existed, "
+          f"{state['invalid']} invalid")
+    if timings["records"]:
+        print(f"   {timings['records'] / elapsed:.0f} records/s this run; "
+              f"waiting on hashing {timings['hash_wait']:.1f}s, database {timings['db']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
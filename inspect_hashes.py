@@ -0,0 +1,30 @@
+from sqlalchemy import func
+
+from app import app, db, User, password_hasher
+from password_hasher import time_hash
+
+# Cost distribution of stored bcrypt hashes ("$2b$12$..." -> cost 12).
+# Hashes below the current cost are upgraded on the user's next login.
+
+with app.app_context():
+    cost = func.substr(User.password_hash, 5, 2)
+    rows = db.session.query(cost, func.count()).group_by(cost).order_by(cost).all()
+    total = sum(count for _, count in rows)
+
+    print(f"Current bcrypt cost: {password_hasher.rounds} (~{time_hash(password_hasher.rounds, samples=1) * 1000:.0f}ms per hash on this host)")
+    if not total:
+        print("⚠️ No users found in the database.")
+    else:
+        print(f"✅ {total} password hash(es):")
+        pending = 0
+        for value, count in rows:
+            rounds = int(value) if value and value.isdigit() else None
+            if rounds is None:
+                label = "unrecognized"
+            else:
+                label = f"cost {rounds}"
+                if rounds < password_hasher.rounds:
+                    label += " (upgrade on next login)"
+                    pending += count
+            print(f"- {label}: {count} ({count / total:.1%})")
+        print(f"{pending} hash(es) below the current cost")
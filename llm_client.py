@@ -0,0 +1,225 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LLM_CONNECT_SECONDS = REGISTRY.histogram(
+    "llm_connect_seconds", "Time spent opening new upstream connections", ["phase"]
+)
+LLM_CONNECTIONS_OPENED = REGISTRY.counter(
+    "llm_connections_opened_total", "New upstream connections (connection pool misses)", ["host"]
+)
+
+# =============================================
+# SHARED LLM CLIENTS
+# =============================================
+#
+# One OpenAI client (and therefore one httpx connection pool) per endpoint per
+# process. The client is thread-safe, so every request thread in a worker
+# shares it and reuses warm keep-alive connections instead of paying a new TLS
+# handshake. Gunicorn forks workers after import, so clients are rebuilt
+# lazily in each child the first time they are used there rather than sharing
+# the parent's sockets.
+
+_clients = {}  # (base_url, api_key) -> client
+_clients_pid = None
+_client_lock = threading.Lock()
+
+# Async clients' connection pools are tied to the event loop they were first used on
+_async_clients = {}
+_async_clients_loop = None
+
+
+def get_pool_settings():
+    """Read connection pool settings from the environment"""
+    return {
+        "max_connections": int(os.getenv("LLM_POOL_MAX_CONNECTIONS", 20)),
+        "max_keepalive_connections": int(os.getenv("LLM_POOL_MAX_KEEPALIVE", 10)),
+        "keepalive_expiry": float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", 60)),
+        "connect_timeout": float(os.getenv("LLM_CONNECT_TIMEOUT", 5)),
+        "request_timeout": float(os.getenv("LLM_REQUEST_TIMEOUT", 15)),
+        "max_retries": int(os.getenv("LLM_MAX_RETRIES", 1)),
+    }
+
+
+class _ConnectTrace:
+    """httpcore trace hook that times TCP connect and TLS handshake for new connections"""
+
+    PHASES = {"connection.connect_tcp": "tcp", "connection.start_tls": "tls"}
+
+    def __init__(self, host):
+        self.host = host
+        self._started = {}
+
+    def __call__(self, event_name, info):
+        prefix, _, stage = event_name.rpartition(".")
+        phase = self.PHASES.get(prefix)
+        if phase is None:
+            return
+        if stage == "started":
+            self._started[phase] = time.perf_counter()
+        elif stage == "complete" and phase in self._started:
+            LLM_CONNECT_SECONDS.observe(time.perf_counter() - self._started.pop(phase), phase=phase)
+            if phase == "tcp":
+                LLM_CONNECTIONS_OPENED.inc(host=self.host)
+
+
+class TracingTransport(httpx.HTTPTransport):
+    def handle_request(self, request):
+        request.extensions["trace"] = _ConnectTrace(request.url.host)
+        return super().handle_request(request)
+
+
+class AsyncTracingTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request):
+        tracer = _ConnectTrace(request.url.host)
+
+        async def trace(event_name, info):
+            tracer(event_name, info)
+
+        request.extensions["trace"] = trace
+        return await super().handle_async_request(request)
+
+
+def _pool_limits(settings):
+    return httpx.Limits(
+        max_connections=settings["max_connections"],
+        max_keepalive_connections=settings["max_keepalive_connections"],
+        keepalive_expiry=settings["keepalive_expiry"],
+    )
+
+
+def build_http_client(settings):
+    """Create the pooled httpx client used underneath the OpenAI client"""
+    return DefaultHttpxClient(
+        transport=TracingTransport(limits=_pool_limits(settings)),
+        timeout=httpx.Timeout(settings["request_timeout"], connect=settings["connect_timeout"]),
+    )
+
+
+def build_async_http_client(settings):
+    """Create the pooled httpx client used underneath the async OpenAI client"""
+    return DefaultAsyncHttpxClient(
+        transport=AsyncTracingTransport(limits=_pool_limits(settings)),
+        timeout=httpx.Timeout(settings["request_timeout"], connect=settings["connect_timeout"]),
+    )
+
+
+def _resolve(base_url, api_key):
+    # Defaults match the OpenAI SDK's own environment handling
+    api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+    base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+    return base_url, (api_key.strip() if api_key else None)
+
+
+def _create_client(base_url, api_key, is_async=False):
+    settings = get_pool_settings()
+    if is_async:
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=build_async_http_client(settings),
+            max_retries=settings["max_retries"],
+        )
+    else:
+        client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=build_http_client(settings),
+            max_retries=settings["max_retries"],
+        )
+    logger.info(
+        f"{'Async LLM' if is_async else 'LLM'} client created for pid {os.getpid()} "
+        f"({client.base_url}, max_connections={settings['max_connections']}, "
+        f"keepalive={settings['max_keepalive_connections']})"
+    )
+    return client
+
+
+def get_llm_client(base_url=None, api_key=None):
+    """Return the process-wide OpenAI client for an endpoint, creating it on first use.
+
+    With no arguments this is the default endpoint from OPENAI_API_KEY /
+    OPENAI_BASE_URL. Returns None when no API key is available.
+    """
+    global _clients_pid
+
+    base_url, api_key = _resolve(base_url, api_key)
+    if not api_key:
+        return None
+
+    key = (base_url, api_key)
+    pid = os.getpid()
+    client = _clients.get(key)
+    if client is not None and _clients_pid == pid:
+        return client
+
+    with _client_lock:
+        if _clients_pid != pid:
+            # After a fork the inherited clients' sockets belong to the parent,
+            # so drop the references without closing them and start fresh pools.
+            _clients.clear()
+            _clients_pid = pid
+        if key not in _clients:
+            _clients[key] = _create_client(base_url, api_key)
+        return _clients[key]
+
+
+def get_async_llm_client(base_url=None, api_key=None):
+    """Return the async OpenAI client for an endpoint on the running event loop"""
+    global _async_clients_loop
+
+    base_url, api_key = _resolve(base_url, api_key)
+    if not api_key:
+        return None
+
+    key = (base_url, api_key)
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(key)
+    if client is not None and _async_clients_loop is loop:
+        return client
+
+    with _client_lock:
+        if _async_clients_loop is not loop:
+            _async_clients.clear()
+            _async_clients_loop = loop
+        if key not in _async_clients:
+            _async_clients[key] = _create_client(base_url, api_key, is_async=True)
+        return _async_clients[key]
+
+
+def reset_llm_client():
+    """Close the shared clients so the next call rebuilds them (e.g. after a key rotation)"""
+    global _clients_pid, _async_clients_loop
+
+    with _client_lock:
+        if _clients_pid == os.getpid():
+            for client in _clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    logger.warning(f"Failed to close LLM client: {str(e)}")
+        _clients.clear()
+        _clients_pid = None
+        # Async pools can only be closed from their own loop; see close_async_llm_client()
+        _async_clients.clear()
+        _async_clients_loop = None
+
+
+async def close_async_llm_client():
+    """Close the async clients' connection pools (call on event loop shutdown)"""
+    global _async_clients_loop
+
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    _async_clients_loop = None
+    for client in clients:
+        await client.close()
@@ -0,0 +1,409 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import openai
+
+from circuit_breaker import CircuitBreaker
+from llm_client import get_llm_client, get_async_llm_client
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# =============================================
+# LLM PROVIDERS AND LATENCY-AWARE ROUTING
+# =============================================
+#
+# Any number of OpenAI-compatible endpoints can be configured through
+# LLM_PROVIDERS, a JSON list such as:
+#
+#   [{"name": "openai", "model": "gpt-3.5-turbo", "api_key_env": "OPENAI_API_KEY"},
+#    {"name": "local", "base_url": "http://127.0.0.1:8000/v1", "model": "llama-3-8b", "api_key": "none"}]
+#
+# Each request goes to the healthy provider with the best recent score (p95
+# latency plus an error-rate penalty). If it has not answered after
+# LLM_HEDGE_DELAY seconds a second request is hedged to the next provider, a
+# failed attempt fails over immediately, and the whole call is bounded by
+# LLM_DEADLINE_SECONDS. Routed and streamed calls go through provider clients
+# with the SDK's own retries turned off, so retries never stretch an attempt
+# past the deadline. Without LLM_PROVIDERS a single provider is built from
+# OPENAI_API_KEY / OPENAI_BASE_URL / LLM_MODEL.
+#
+# Blocking completions only use the router's thread pool when they can
+# actually hedge. A hedge loser can't be cancelled and keeps its thread until
+# its own timeout, so the pool (LLM_ROUTER_THREADS) bounds hedged calls
+# only. With a single provider, hedging off, or every pool thread busy, the
+# attempts run one after another on the request thread, and a hedge that
+# finds the pool full is skipped.
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+MIN_SAMPLES_FOR_SCORE = 3
+
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "llm_request_seconds", "Upstream completion latency per attempt", ["provider", "outcome"]
+)
+LLM_TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "llm_time_to_first_token_seconds", "Time from request to first streamed token", ["provider"]
+)
+LLM_TIMEOUTS = REGISTRY.counter("llm_timeouts_total", "Upstream attempts that timed out", ["provider"])
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens reported by upstream usage", ["provider", "kind"])
+LLM_ROUTER_EVENTS = REGISTRY.counter(
+    "llm_router_events_total", "Hedges fired, won and skipped, and total deadlines exceeded", ["event"]
+)
+
+# Reply text plus upstream token usage (None when the provider did not report it)
+Completion = namedtuple("Completion", "text provider prompt_tokens completion_tokens")
+
+
+def is_timeout(error):
+    return isinstance(error, (openai.APITimeoutError, TimeoutError))
+
+
+class LLMProvider:
+    """One OpenAI-compatible endpoint with its own breaker and latency window"""
+
+    def __init__(self, name, model, base_url=None, api_key=None, window=50):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.breaker = CircuitBreaker.from_env(name, "LLM_BREAKER")
+        self._samples = deque(maxlen=window)  # (latency, ok)
+        self._lock = threading.Lock()
+        self._client = self._async_client = (None, None)  # (shared client, copy without retries)
+
+    def client(self):
+        self._client = self._without_retries(get_llm_client(self.base_url, self.api_key), self._client)
+        return self._client[1]
+
+    def async_client(self):
+        self._async_client = self._without_retries(get_async_llm_client(self.base_url, self.api_key),
+                                                   self._async_client)
+        return self._async_client[1]
+
+    @staticmethod
+    def _without_retries(shared, cached):
+        """(shared client, its copy with SDK retries off). The router fails over
+        itself, and a retry inside one attempt would run past the total deadline.
+        The copy is remade when llm_client hands out a new shared client (after a
+        fork, or on a new event loop)."""
+        if shared is None:
+            return None, None
+        if cached[0] is shared:
+            return cached
+        return shared, shared.with_options(max_retries=0)
+
+    def record(self, latency, ok, error=None):
+        with self._lock:
+            self._samples.append((latency, ok))
+        if ok:
+            self.breaker.record_success(latency)
+            LLM_REQUEST_SECONDS.observe(latency, provider=self.name, outcome="ok")
+        else:
+            self.breaker.record_failure(latency)
+            timed_out = is_timeout(error)
+            if timed_out:
+                LLM_TIMEOUTS.inc(provider=self.name)
+            LLM_REQUEST_SECONDS.observe(latency, provider=self.name, outcome="timeout" if timed_out else "error")
+
+    def record_abandoned(self, latency):
+        """A cancelled attempt (e.g. a hedge loser): its elapsed time is a lower
+        bound on latency, so it still informs routing but not the breaker"""
+        with self._lock:
+            self._samples.append((latency, True))
+        LLM_REQUEST_SECONDS.observe(latency, provider=self.name, outcome="abandoned")
+
+    def record_first_token(self, latency):
+        LLM_TIME_TO_FIRST_TOKEN.observe(latency, provider=self.name)
+
+    def record_usage(self, usage):
+        """Count tokens from an OpenAI usage object; returns (prompt, completion) or (None, None)"""
+        if usage is None:
+            return None, None
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        LLM_TOKENS.inc(prompt_tokens, provider=self.name, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, provider=self.name, kind="completion")
+        return prompt_tokens, completion_tokens
+
+    def stats(self):
+        with self._lock:
+            samples = list(self._samples)
+        latencies = sorted(latency for latency, ok in samples if ok)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None
+        error_rate = sum(1 for _, ok in samples if not ok) / len(samples) if samples else 0.0
+        return len(samples), p95, error_rate
+
+    def score(self, deadline):
+        """Lower is better; providers without enough samples score 0 so they get explored"""
+        calls, p95, error_rate = self.stats()
+        if calls < MIN_SAMPLES_FOR_SCORE:
+            return 0.0
+        # A failed call costs roughly a full deadline's worth of waiting
+        return (p95 if p95 is not None else deadline) + error_rate * deadline
+
+    def snapshot(self, deadline):
+        calls, p95, error_rate = self.stats()
+        return {
+            "name": self.name,
+            "model": self.model,
+            "base_url": self.base_url or "default",
+            "window_calls": calls,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "error_rate": round(error_rate, 3),
+            "score": round(self.score(deadline), 3),
+            "breaker": self.breaker.snapshot(),
+        }
+
+
+def _reply_text(response):
+    if response.choices and response.choices[0].message and response.choices[0].message.content:
+        return response.choices[0].message.content.strip()
+    return None
+
+
+class LLMRouter:
+    """Routes completions across providers with hedging, failover and a total deadline"""
+
+    def __init__(self, providers, hedge_delay=3.0, deadline=15.0, threads=16):
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="llm")
+        # Free pool threads; taken per submitted attempt, given back when it finishes
+        self._free_threads = threading.BoundedSemaphore(threads)
+
+    @classmethod
+    def from_env(cls):
+        window = int(os.getenv("LLM_ROUTER_WINDOW", 50))
+        raw = os.getenv("LLM_PROVIDERS")
+        providers = []
+        if raw:
+            for entry in json.loads(raw):
+                api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", "OPENAI_API_KEY"))
+                if not api_key:
+                    logger.warning(f"LLM provider '{entry.get('name')}' skipped: no API key")
+                    continue
+                providers.append(LLMProvider(
+                    entry.get("name") or entry.get("base_url") or "openai",
+                    entry.get("model", DEFAULT_MODEL),
+                    base_url=entry.get("base_url"),
+                    api_key=api_key,
+                    window=window,
+                ))
+        elif os.getenv("OPENAI_API_KEY"):
+            providers.append(LLMProvider("openai", os.getenv("LLM_MODEL", DEFAULT_MODEL), window=window))
+
+        router = cls(
+            providers,
+            hedge_delay=float(os.getenv("LLM_HEDGE_DELAY", 3)),
+            deadline=float(os.getenv("LLM_DEADLINE_SECONDS", 15)),
+            threads=int(os.getenv("LLM_ROUTER_THREADS", 16)),
+        )
+        if providers:
+            logger.info(f"LLM router providers: {', '.join(f'{p.name} ({p.model})' for p in providers)}")
+        return router
+
+    def available(self):
+        return bool(self.providers)
+
+    def _ranked(self):
+        return sorted(self.providers, key=lambda p: p.score(self.deadline))
+
+    def _next_allowed(self, candidates):
+        # allow_request() may reserve a half-open probe slot, so only ask the
+        # breaker of a provider we are about to call
+        for provider in candidates:
+            if provider.breaker.allow_request():
+                return provider
+        return None
+
+    def pick(self):
+        """Best provider whose breaker admits a call (for streaming), or None"""
+        return self._next_allowed(self._ranked())
+
+    def _attempt(self, provider, messages, params, timeout):
+        started = time.monotonic()
+        try:
+            response = provider.client().chat.completions.create(
+                model=provider.model, messages=messages, timeout=timeout, **params
+            )
+        except Exception as e:
+            provider.record(time.monotonic() - started, False, e)
+            raise
+        provider.record(time.monotonic() - started, True)
+        return Completion(_reply_text(response), provider.name, *provider.record_usage(response.usage))
+
+    def _submit(self, provider, messages, params, timeout):
+        future = self._executor.submit(self._attempt, provider, messages, params, timeout)
+        future.add_done_callback(lambda _: self._free_threads.release())
+        return future
+
+    def _complete_inline(self, candidates, messages, params, deadline_at, last_error=None):
+        """Attempts one at a time on the calling thread: failover without hedging"""
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                LLM_ROUTER_EVENTS.inc(event="deadline_exceeded")
+                raise TimeoutError(f"LLM deadline of {self.deadline}s exceeded")
+            provider = self._next_allowed(candidates)
+            if provider is None:
+                if last_error is not None:
+                    raise last_error
+                return None
+            try:
+                return self._attempt(provider, messages, params, remaining)
+            except Exception as e:
+                logger.warning(f"LLM provider '{provider.name}' failed: {str(e)}")
+                last_error = e
+
+    def complete(self, messages, **params):
+        """Blocking completion; returns a Completion, None if every breaker is open, or raises"""
+        started = time.monotonic()
+        deadline_at = started + self.deadline
+        candidates = iter(self._ranked())
+        if self.hedge_delay <= 0 or len(self.providers) < 2:
+            return self._complete_inline(candidates, messages, params, deadline_at)
+
+        hedge_at = started + self.hedge_delay
+        pending = {}
+        primary = None
+        in_flight = 1  # becomes 2 once the hedge delay has passed
+        last_error = None
+
+        while True:
+            # Keep `in_flight` attempts running; a failed attempt is replaced
+            # by the next provider immediately (failover)
+            while len(pending) < in_flight:
+                if not self._free_threads.acquire(blocking=False):
+                    if pending:
+                        # Pool is full: keep waiting on the attempt we have
+                        LLM_ROUTER_EVENTS.inc(event="hedge_skipped")
+                        in_flight = len(pending)
+                        break
+                    return self._complete_inline(candidates, messages, params, deadline_at, last_error)
+                provider = self._next_allowed(candidates)
+                if provider is None:
+                    self._free_threads.release()
+                    break
+                remaining = deadline_at - time.monotonic()
+                future = self._submit(provider, messages, params, remaining)
+                pending[future] = provider
+                if primary is None:
+                    primary = future
+                elif in_flight > 1 and len(pending) > 1:
+                    LLM_ROUTER_EVENTS.inc(event="hedge_fired")
+            if not pending:
+                if last_error is not None:
+                    raise last_error
+                return None
+
+            now = time.monotonic()
+            if now >= deadline_at:
+                LLM_ROUTER_EVENTS.inc(event="deadline_exceeded")
+                raise TimeoutError(f"LLM deadline of {self.deadline}s exceeded")
+            wake_at = deadline_at if hedge_at is None else min(deadline_at, hedge_at)
+
+            done, _ = wait(pending, timeout=max(0.0, wake_at - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    reply = future.result()
+                except Exception as e:
+                    logger.warning(f"LLM provider '{provider.name}' failed: {str(e)}")
+                    last_error = e
+                    continue
+                if future is not primary:
+                    LLM_ROUTER_EVENTS.inc(event="hedge_won")
+                return reply
+
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                hedge_at = None
+                in_flight = 2
+
+    async def _aattempt(self, provider, messages, params, timeout):
+        started = time.monotonic()
+        try:
+            response = await provider.async_client().chat.completions.create(
+                model=provider.model, messages=messages, timeout=timeout, **params
+            )
+        except asyncio.CancelledError:
+            provider.record_abandoned(time.monotonic() - started)
+            raise
+        except Exception as e:
+            provider.record(time.monotonic() - started, False, e)
+            raise
+        provider.record(time.monotonic() - started, True)
+        return Completion(_reply_text(response), provider.name, *provider.record_usage(response.usage))
+
+    async def acomplete(self, messages, **params):
+        """Async twin of complete(); losing attempts are cancelled"""
+        started = time.monotonic()
+        deadline_at = started + self.deadline
+        hedge_at = started + self.hedge_delay if self.hedge_delay > 0 else None
+        candidates = iter(self._ranked())
+        pending = {}
+        primary = None
+        in_flight = 1
+        last_error = None
+
+        try:
+            while True:
+                while len(pending) < in_flight:
+                    provider = self._next_allowed(candidates)
+                    if provider is None:
+                        break
+                    remaining = deadline_at - time.monotonic()
+                    task = asyncio.ensure_future(self._aattempt(provider, messages, params, remaining))
+                    pending[task] = provider
+                    if primary is None:
+                        primary = task
+                    elif in_flight > 1 and len(pending) > 1:
+                        LLM_ROUTER_EVENTS.inc(event="hedge_fired")
+                if not pending:
+                    if last_error is not None:
+                        raise last_error
+                    return None
+
+                now = time.monotonic()
+                if now >= deadline_at:
+                    LLM_ROUTER_EVENTS.inc(event="deadline_exceeded")
+                    raise TimeoutError(f"LLM deadline of {self.deadline}s exceeded")
+                wake_at = deadline_at if hedge_at is None else min(deadline_at, hedge_at)
+
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, wake_at - now),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        reply = task.result()
+                    except Exception as e:
+                        logger.warning(f"LLM provider '{provider.name}' failed: {str(e)}")
+                        last_error = e
+                        continue
+                    if task is not primary:
+                        LLM_ROUTER_EVENTS.inc(event="hedge_won")
+                    return reply
+
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    in_flight = 2
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self):
+        return {
+            "hedge_delay_seconds": self.hedge_delay,
+            "deadline_seconds": self.deadline,
+            "hedges_fired": LLM_ROUTER_EVENTS.value(event="hedge_fired"),
+            "hedges_won": LLM_ROUTER_EVENTS.value(event="hedge_won"),
+            "hedges_skipped": LLM_ROUTER_EVENTS.value(event="hedge_skipped"),
+            "deadlines_exceeded": LLM_ROUTER_EVENTS.value(event="deadline_exceeded"),
+            "providers": [p.snapshot(self.deadline) for p in self._ranked()],
+        }
@@ -1,5 +1,6 @@
 from extensions import db, bcrypt
 from datetime import datetime
+from sqlalchemy import func
 
 class User(db.Model):
     __tablename__ = "users"
@@ -11,6 +12,9 @@ class User(db.Model):
     password_hash = db.Column(db.String(128), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Emails are unique regardless of case; auth.register_user() relies on it
+    __table_args__ = (db.Index("ux_users_email_lower", func.lower(email), unique=True),)
+
     def set_password(self, password):
         self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
 
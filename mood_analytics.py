@@ -0,0 +1,178 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+# =============================================
+# MOOD ANALYTICS
+# =============================================
+#
+# Summaries for GET /api/analytics, computed from a user's check-in and mood
+# metric columns. Timestamps arrive as UTC epoch seconds, which the database
+# computes, so no per-row datetime objects are built. The columns become numpy
+# arrays once, and everything after that is whole-array arithmetic.
+#
+# Every timestamp is mapped to a local calendar day: one searchsorted against
+# that user's local midnights, so DST days come out as 23 or 25 hours.
+# np.bincount then gives per-day sums and counts on a dense day axis ending
+# today. From there:
+#
+#   moving averages  trailing 7 and 30 calendar days, from cumulative sums
+#   streak           runs of consecutive days with a check-in
+#   trend            this week's mean mood (today and the 6 days before) vs the 7 days before
+#   correlations     Pearson r of energy_level / anxiety_level with the check-in's mood value
+#
+# Averages weight every reading equally, so a day with three check-ins counts
+# three times.
+
+MOVING_AVERAGE_WINDOWS = (7, 30)
+TREND_FLAT_THRESHOLD = 0.1  # mood points; smaller week-over-week changes are "flat"
+MIN_CORRELATION_SAMPLES = 3
+
+
+def _number(value, digits=3):
+    """JSON-friendly float: rounded, with NaN as None"""
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def _numbers(values, digits=3):
+    """_number() for a whole array"""
+    return [None if value != value else value for value in np.round(values, digits).tolist()]
+
+
+def _timestamp(seconds):
+    # Naive UTC ISO 8601, like the models' to_dict()
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def local_midnights(zone, origin, count):
+    """Epoch seconds of count consecutive local midnights in zone, starting at origin"""
+    return np.array([
+        datetime(day.year, day.month, day.day, tzinfo=zone).timestamp()
+        for day in (origin + timedelta(days=offset) for offset in range(count))
+    ])
+
+
+def moving_average(sums, counts, window):
+    """Trailing mean over the last `window` days for each day; NaN where the window has no readings"""
+    total = np.concatenate(([0.0], np.cumsum(sums)))
+    number = np.concatenate(([0], np.cumsum(counts)))
+    end = np.arange(1, len(sums) + 1)
+    start = np.maximum(end - window, 0)
+    window_counts = number[end] - number[start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(window_counts > 0, (total[end] - total[start]) / window_counts, np.nan)
+
+
+def streaks(active):
+    """(current, longest) runs of consecutive active days; today not being active yet doesn't end the current one"""
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if not len(starts):
+        return 0, 0
+    lengths = ends - starts
+    current = int(lengths[-1]) if ends[-1] >= len(active) - 1 else 0
+    return current, int(lengths.max())
+
+
+def correlation(a, b):
+    """Pearson r over the pairs where both values are present, and the number of pairs"""
+    present = ~(np.isnan(a) | np.isnan(b))
+    samples = int(present.sum())
+    if samples < MIN_CORRELATION_SAMPLES:
+        return None, samples
+    a, b = a[present] - a[present].mean(), b[present] - b[present].mean()
+    spread = np.sqrt((a * a).sum() * (b * b).sum())
+    return (float((a * b).sum() / spread) if spread else None), samples
+
+
+def analyze_moods(checkins, metrics, mood_values, zone, today, days=90):
+    """Analytics for one user.
+
+    checkins: (epoch seconds, mood, energy_level, anxiety_level) rows in date order.
+    metrics: (epoch seconds, value) rows of the "mood" progress metric in date order.
+    mood_values maps mood names to scores. days is the length of the
+    moving-average series, ending today.
+    """
+    checkin_times, moods, energy, anxiety = zip(*checkins) if checkins else ((), (), (), ())
+    metric_times, values = zip(*metrics) if metrics else ((), ())
+    checkin_times = np.array(checkin_times, dtype=float)
+    metric_times = np.array(metric_times, dtype=float)
+    energy = np.array(energy, dtype=float)  # missing levels (None) become NaN
+    anxiety = np.array(anxiety, dtype=float)
+    values = np.array(values, dtype=float)
+
+    # Mood names -> scores through a lookup table, one entry per distinct mood
+    names, inverse = np.unique(np.array(moods, dtype=str), return_inverse=True)
+    mood_scores = np.array([mood_values.get(name, np.nan) for name in names], dtype=float)[inverse]
+
+    # Day axis: far enough back for the series, its widest moving average and all the data
+    earliest = [times[0] for times in (checkin_times, metric_times) if len(times)]
+    origin = today - timedelta(days=days + max(MOVING_AVERAGE_WINDOWS))
+    if earliest:
+        origin = min(origin, datetime.fromtimestamp(min(earliest), zone).date())
+    length = (today - origin).days + 1
+
+    # Day number (0 = origin) of every timestamp; -1 before origin, length after today
+    midnights = local_midnights(zone, origin, length + 1)
+    checkin_days = np.searchsorted(midnights, checkin_times, side="right") - 1
+    metric_days = np.searchsorted(midnights, metric_times, side="right") - 1
+    on_axis = (metric_days >= 0) & (metric_days < length)
+    sums = np.bincount(metric_days[on_axis], weights=values[on_axis], minlength=length)
+    counts = np.bincount(metric_days[on_axis], minlength=length)
+    active = np.bincount(checkin_days[(checkin_days >= 0) & (checkin_days < length)], minlength=length) > 0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    shown = slice(length - days, length)
+    columns = {
+        "mood": _numbers(daily[shown]),
+        "checkins": counts[shown].tolist(),
+        **{f"ma{window}": _numbers(moving_average(sums, counts, window)[shown]) for window in MOVING_AVERAGE_WINDOWS},
+    }
+    series = [
+        {"date": (today - timedelta(days=days - 1 - offset)).isoformat(),
+         **{name: column[offset] for name, column in columns.items()}}
+        for offset in range(days)
+    ]
+
+    def week_mean(first, last):
+        readings = counts[first:last].sum()
+        return sums[first:last].sum() / readings if readings else np.nan
+
+    this_week, last_week = week_mean(length - 7, length), week_mean(length - 14, length - 7)
+    change = this_week - last_week
+    if np.isnan(change):
+        direction = None
+    elif abs(change) < TREND_FLAT_THRESHOLD:
+        direction = "flat"
+    else:
+        direction = "up" if change > 0 else "down"
+
+    current, longest = streaks(active)
+    active_days = np.flatnonzero(active)
+    energy_r, energy_samples = correlation(energy, mood_scores)
+    anxiety_r, anxiety_samples = correlation(anxiety, mood_scores)
+
+    return {
+        "checkins": len(checkin_times),
+        "days_with_checkins": int(active.sum()),
+        "first_checkin": _timestamp(checkin_times[0]) if len(checkin_times) else None,
+        "last_checkin": _timestamp(checkin_times[-1]) if len(checkin_times) else None,
+        "average_mood": _number(values.mean()) if len(values) else None,
+        "streak": {
+            "current": current,
+            "longest": longest,
+            "last_day": (origin + timedelta(days=int(active_days[-1]))).isoformat() if len(active_days) else None,
+        },
+        "trend": {
+            "this_week": _number(this_week),
+            "last_week": _number(last_week),
+            "change": _number(change),
+            "direction": direction,
+        },
+        "correlations": {
+            "energy_level": {"r": _number(energy_r), "samples": energy_samples},
+            "anxiety_level": {"r": _number(anxiety_r), "samples": anxiety_samples},
+        },
+        "moving_averages": {"windows": list(MOVING_AVERAGE_WINDOWS), "series": series},
+    }
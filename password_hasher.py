@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import hmac
+import hashlib
+import logging
+import threading
+import subprocess
+import multiprocessing
+from itertools import repeat
+from multiprocessing.connection import Client
+
+import bcrypt
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# =============================================
+# PASSWORD HASHING WORKER POOL
+# =============================================
+#
+# bcrypt is deliberately slow, so running it on the request thread lets a
+# burst of logins starve every other route in the worker. Hashing and
+# verification run in a small process pool instead, hosted by a separate
+# `python -m password_worker` process (see password_worker.py) so the pool's
+# workers never re-import the app's main script. At most
+# PASSWORD_HASH_MAX_PENDING jobs are queued or running at once, and callers
+# wait at most PASSWORD_HASH_TIMEOUT seconds. Past either limit the caller
+# gets PasswordHasherBusy (HTTP 503) instead of joining an unbounded queue.
+# Hashes are byte-for-byte what Flask-Bcrypt produces, so existing
+# password_hash values keep working. PASSWORD_HASH_WORKERS=0 hashes inline.
+#
+# The bcrypt cost is calibrated at startup: the largest cost whose hash fits
+# PASSWORD_HASH_TARGET_SECONDS on this hardware, never below
+# PASSWORD_HASH_MIN_ROUNDS (default 12, the previous fixed cost). An explicit
+# BCRYPT_LOG_ROUNDS skips calibration.
+# Hashes stored with a lower cost are upgraded on the user's next login.
+
+MAX_ROUNDS = 16
+
+PASSWORD_HASH_SECONDS = REGISTRY.histogram(
+    "password_hash_seconds", "Password hash/verify latency including queueing", ["op"]
+)
+PASSWORD_HASH_REJECTED = REGISTRY.counter(
+    "password_hash_rejected_total", "Password hash/verify calls rejected by the pool", ["reason"]
+)
+
+
+class PasswordHasherBusy(Exception):
+    """The hashing pool is saturated, timed out or broken; callers should answer 503"""
+
+    def __init__(self, reason):
+        super().__init__(f"Password hashing unavailable ({reason})")
+        self.reason = reason
+
+
+def _to_bytes(value):
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+
+def _prepare(password, handle_long_passwords):
+    password = _to_bytes(password)
+    if handle_long_passwords:
+        password = _to_bytes(hashlib.sha256(password).hexdigest())
+    return password
+
+
+# Module-level so the pool can pickle them by reference; JOBS maps the ops
+# password_worker accepts to them
+
+def _hash_password(password, rounds, prefix, handle_long_passwords):
+    if not password:
+        raise ValueError("Password must be non-empty.")
+    salt = bcrypt.gensalt(rounds=rounds, prefix=_to_bytes(prefix))
+    return bcrypt.hashpw(_prepare(password, handle_long_passwords), salt).decode("utf-8")
+
+
+def _verify_password(password_hash, password, handle_long_passwords):
+    password_hash = _to_bytes(password_hash)
+    candidate = bcrypt.hashpw(_prepare(password, handle_long_passwords), password_hash)
+    return hmac.compare_digest(candidate, password_hash)
+
+
+JOBS = {"hash": _hash_password, "verify": _verify_password}
+
+
+def hash_rounds(password_hash):
+    """Cost factor of a stored bcrypt hash ("$2b$12$..." -> 12), or None if it isn't one"""
+    parts = (password_hash or "").split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def time_hash(rounds, samples=2):
+    """Best-of-N wall time for one bcrypt hash at this cost on the current machine"""
+    salt = bcrypt.gensalt(rounds=rounds)
+    best = None
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.hashpw(b"calibration-password", salt)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate_rounds(target_seconds, min_rounds=12, max_rounds=MAX_ROUNDS):
+    """Largest cost whose hash takes at most target_seconds here (never below min_rounds)"""
+    # Each extra round doubles the work, so time one cheap cost and extrapolate,
+    # then confirm the pick with a real measurement
+    base = time_hash(min_rounds)
+    rounds = min_rounds
+    while rounds < max_rounds and base * 2 ** (rounds + 1 - min_rounds) <= target_seconds:
+        rounds += 1
+    while rounds > min_rounds and time_hash(rounds, samples=1) > target_seconds * 1.25:
+        rounds -= 1
+    return rounds
+
+
+class BrokenPoolHost(Exception):
+    """The password_worker process died, failed to start or lost its pool"""
+
+
+class _PoolHost:
+    """A running password_worker process and idle connections to it"""
+
+    def __init__(self, workers, start_method):
+        self.authkey = os.urandom(32)
+        self._idle = []
+        self._lock = threading.Lock()
+        env = dict(os.environ)
+        here = os.path.dirname(os.path.abspath(__file__))
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [here, env.get("PYTHONPATH")]))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "password_worker", str(workers), start_method],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env,
+        )
+        self.process.stdin.write(self.authkey.hex().encode("ascii") + b"\n")
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            self.close()
+            raise BrokenPoolHost("password_worker exited during startup")
+        address = json.loads(line)
+        self.address = tuple(address) if isinstance(address, list) else address
+
+    def connect(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return Client(self.address, authkey=self.authkey)
+        except (OSError, EOFError) as e:
+            raise BrokenPoolHost(str(e))
+
+    def release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def call(self, conn, timeout=None):
+        """Wait for the reply to a job sent on conn; returns (status, value), or None after timeout"""
+        try:
+            if timeout is not None and not conn.poll(timeout):
+                return None
+            status, value = conn.recv()
+        except (OSError, EOFError) as e:
+            conn.close()
+            raise BrokenPoolHost(str(e))
+        if status == "broken":
+            conn.close()
+            raise BrokenPoolHost(value)
+        return status, value
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        # Closing stdin tells the host to stop; it exits once running jobs finish
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.stdout.close()
+
+
+class PasswordHasher:
+    def __init__(self, workers=None, max_pending=None, timeout=5.0, rounds=12, prefix="2b",
+                 handle_long_passwords=False, start_method="forkserver"):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending if max_pending is not None else max(1, self.workers) * 8
+        self.timeout = timeout
+        self.rounds = rounds
+        self.prefix = prefix
+        self.handle_long_passwords = handle_long_passwords
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = "spawn"
+        self.start_method = start_method
+        self._host = None
+        self._host_pid = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, config):
+        """Pool settings from PASSWORD_HASH_*; bcrypt settings from the Flask-Bcrypt config keys"""
+        workers = os.getenv("PASSWORD_HASH_WORKERS")
+        max_pending = os.getenv("PASSWORD_HASH_MAX_PENDING")
+        target = float(os.getenv("PASSWORD_HASH_TARGET_SECONDS", 0.25))
+        if os.getenv("BCRYPT_LOG_ROUNDS"):
+            rounds = int(os.getenv("BCRYPT_LOG_ROUNDS"))
+        elif target > 0 and "BCRYPT_LOG_ROUNDS" not in config:
+            started = time.perf_counter()
+            rounds = calibrate_rounds(target, min_rounds=int(os.getenv("PASSWORD_HASH_MIN_ROUNDS", 12)))
+            logger.info(
+                f"Calibrated bcrypt cost {rounds} for a {target * 1000:.0f}ms budget "
+                f"(took {time.perf_counter() - started:.2f}s)"
+            )
+        else:
+            rounds = config.get("BCRYPT_LOG_ROUNDS", 12)
+        return cls(
+            workers=int(workers) if workers else None,
+            max_pending=int(max_pending) if max_pending else None,
+            timeout=float(os.getenv("PASSWORD_HASH_TIMEOUT", 5)),
+            rounds=rounds,
+            prefix=config.get("BCRYPT_HASH_PREFIX", "2b"),
+            handle_long_passwords=config.get("BCRYPT_HANDLE_LONG_PASSWORDS", False),
+            start_method=os.getenv("PASSWORD_HASH_START_METHOD", "forkserver"),
+        )
+
+    def _get_host(self):
+        # Started lazily and per process: a host inherited across a gunicorn
+        # fork belongs to the parent, so each worker starts its own
+        pid = os.getpid()
+        with self._lock:
+            if self._host is None or self._host_pid != pid:
+                self._host = _PoolHost(self.workers, self.start_method)
+                self._host_pid = pid
+                self._pending = 0
+                logger.info(f"Password hashing pool started for pid {pid} ({self.workers} workers)")
+            return self._host
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _drain(self, host, conn):
+        # A timed-out job still holds its slot until the pool finishes it
+        try:
+            if host.call(conn) is not None:
+                host.release(conn)
+        except BrokenPoolHost:
+            pass
+        finally:
+            self._release()
+
+    def _run(self, op, *args):
+        if self.workers <= 0:
+            with PASSWORD_HASH_SECONDS.time(op=op):
+                return JOBS[op](*args)
+
+        try:
+            host = self._get_host()
+        except BrokenPoolHost:
+            self._discard_host(None)
+            PASSWORD_HASH_REJECTED.inc(reason="broken")
+            raise PasswordHasherBusy("broken")
+        with self._lock:
+            if self._pending >= self.max_pending:
+                PASSWORD_HASH_REJECTED.inc(reason="queue_full")
+                raise PasswordHasherBusy("queue_full")
+            self._pending += 1
+
+        with PASSWORD_HASH_SECONDS.time(op=op):
+            try:
+                conn = host.connect()
+                try:
+                    conn.send((op, args))
+                except (OSError, EOFError) as e:
+                    conn.close()
+                    raise BrokenPoolHost(str(e))
+                reply = host.call(conn, self.timeout)
+            except BrokenPoolHost:
+                self._release()
+                self._discard_host(host)
+                PASSWORD_HASH_REJECTED.inc(reason="broken")
+                raise PasswordHasherBusy("broken")
+            if reply is None:
+                # The slot is freed when the job really finishes, even though
+                # this caller gives up on it now
+                threading.Thread(target=self._drain, args=(host, conn), daemon=True).start()
+                PASSWORD_HASH_REJECTED.inc(reason="timeout")
+                raise PasswordHasherBusy("timeout")
+            self._release()
+            host.release(conn)
+            status, value = reply
+            if status == "error":
+                raise value
+            return value
+
+    def _discard_host(self, host):
+        logger.error("Password hashing pool is broken; it will be restarted on the next call")
+        with self._lock:
+            if self._host is host:
+                self._host = None
+        if host is not None:
+            host.close()
+
+    def hash(self, password):
+        """bcrypt hash of password as a str, in the same format Flask-Bcrypt stores"""
+        return self._run("hash", password, self.rounds, self.prefix, self.handle_long_passwords)
+
+    def hash_many(self, passwords):
+        """Iterator of hashes for a batch of passwords, for bulk jobs such as import_users.py
+
+        The whole batch is submitted to the pool straight away, so callers can
+        do other work while it hashes. Unlike hash() there is no queue limit or
+        timeout; this is not meant for request handlers.
+        """
+        args = (repeat(self.rounds), repeat(self.prefix), repeat(self.handle_long_passwords))
+        if self.workers <= 0:
+            return map(_hash_password, passwords, *args)
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        host = self._get_host()
+        conn = host.connect()
+        conn.send(("hash_many", (list(passwords), (self.rounds, self.prefix, self.handle_long_passwords), chunksize)))
+        return self._receive_many(host, conn)
+
+    def _receive_many(self, host, conn):
+        while True:
+            status, value = host.call(conn)
+            if status == "done":
+                host.release(conn)
+                return
+            if status == "error":
+                conn.close()
+                raise value
+            yield value
+
+    def verify(self, password_hash, password):
+        return self._run("verify", password_hash, password, self.handle_long_passwords)
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash uses a lower cost than this process hashes with"""
+        rounds = hash_rounds(password_hash)
+        return rounds is not None and rounds < self.rounds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "timeout_seconds": self.timeout,
+                "rounds": self.rounds,
+            }
+
+    def collect(self):
+        """Scrape-time gauges for the metrics registry"""
+        stats = self.stats()
+        return [
+            ("password_hash_pending", "gauge", "Password hash/verify jobs queued or running",
+             [({}, stats["pending"])]),
+            ("password_hash_workers", "gauge", "Password hashing worker processes", [({}, stats["workers"])]),
+            ("password_hash_rounds", "gauge", "bcrypt cost used for new hashes", [({}, stats["rounds"])]),
+        ]
+
+    def shutdown(self, wait=True):
+        """Stop the pool, cancelling jobs that have not started; wait=True waits for running ones"""
+        with self._lock:
+            host, self._host = self._host, None
+        if host is None or self._host_pid != os.getpid():
+            return
+        host.close()
+        if wait:
+            host.process.wait()
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import threading
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Listener
+
+from password_hasher import JOBS, _hash_password
+
+# =============================================
+# PASSWORD HASHING POOL HOST
+# =============================================
+#
+# PasswordHasher starts this module with `python -m password_worker` and
+# sends it jobs over a local connection. The bcrypt process pool lives in
+# here, so its forkserver/spawn workers re-import this small module as their
+# main module rather than whatever script started the app: app.py, asgi.py
+# or a script like create_test_user.py never runs again in a hashing worker.
+#
+# The parent writes the connection authkey (hex) on stdin and reads the
+# listener address (JSON) back from stdout. Each request is (op, args) and
+# is answered with ("ok", result) or ("error", exception); "hash_many" sends
+# one ("ok", hash) per password and then ("done", None). If the pool breaks,
+# the host answers ("broken", message) and exits; the parent starts a new
+# one. It also exits when the parent closes stdin or dies.
+
+
+def serve(conn, pool):
+    with conn:
+        while True:
+            try:
+                op, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if op == "hash_many":
+                    passwords, settings, chunksize = args
+                    for password_hash in pool.map(_hash_password, passwords, *map(repeat, settings),
+                                                  chunksize=chunksize):
+                        conn.send(("ok", password_hash))
+                    conn.send(("done", None))
+                else:
+                    conn.send(("ok", pool.submit(JOBS[op], *args).result()))
+            except BrokenProcessPool as e:
+                try:
+                    conn.send(("broken", str(e)))
+                finally:
+                    os._exit(1)
+            except (EOFError, OSError):
+                # The caller gave up on this job and closed its connection
+                return
+            except Exception as e:
+                conn.send(("error", e))
+
+
+def accept(listener, pool):
+    while True:
+        try:
+            conn = listener.accept()
+        except OSError:
+            return
+        except Exception:
+            # A client that failed the authkey handshake
+            continue
+        threading.Thread(target=serve, args=(conn, pool), daemon=True).start()
+
+
+def main():
+    workers, start_method = int(sys.argv[1]), sys.argv[2]
+    authkey = bytes.fromhex(sys.stdin.readline().strip())
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method))
+    listener = Listener(authkey=authkey)
+    threading.Thread(target=accept, args=(listener, pool), daemon=True).start()
+    sys.stdout.write(json.dumps(listener.address) + "\n")
+    sys.stdout.flush()
+
+    # Returns at EOF: the parent shut the pool down or exited
+    try:
+        sys.stdin.read()
+    except (OSError, ValueError):
+        pass
+    listener.close()
+    pool.shutdown(wait=True, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from collections import namedtuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# =============================================
+# SLIDING-WINDOW RATE LIMITING
+# =============================================
+#
+# Protects the bcrypt-heavy auth routes. Each rule allows `limit` attempts per
+# key in any rolling `window` seconds (a sliding log, not fixed buckets, so
+# there is no burst at window boundaries). State lives in a local SQLite file
+# so every gunicorn worker on the host sees the same counts, and each check
+# is one short IMMEDIATE transaction. Rejected attempts are not recorded, so
+# the log never grows past `limit` rows per key. If the store is unavailable
+# the limiter fails open and logs a warning rather than locking users out.
+
+RATE_LIMIT_CHECKS = REGISTRY.counter(
+    "rate_limit_checks_total", "Rate limit decisions by action and result", ["action", "result"]
+)
+RATE_LIMITED = REGISTRY.counter("rate_limited_total", "Requests throttled, by the rule that tripped", ["rule"])
+
+RateLimitRule = namedtuple("RateLimitRule", "name limit window")
+
+
+def parse_rule(name, spec):
+    """'10/60' -> 10 attempts per 60 seconds; '0' or '' disables the rule"""
+    if not spec or spec.strip() == "0":
+        return None
+    limit, _, window = spec.partition("/")
+    return RateLimitRule(name, int(limit), float(window or 60))
+
+
+def hash_key(value):
+    # Emails are stored hashed so the limiter file holds no addresses
+    return hashlib.sha256(str(value).strip().lower().encode("utf-8")).hexdigest()[:32]
+
+
+class SlidingWindowLimiter:
+    def __init__(self, path):
+        self.path = path
+        self._calls = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_events ("
+                " key TEXT NOT NULL, ts REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_events_key_ts ON rate_limit_events (key, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_events_expires ON rate_limit_events (expires_at)")
+
+    @classmethod
+    def from_env(cls, data_dir):
+        if os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            logger.info("Auth rate limiting disabled")
+            return None
+        return cls(os.getenv("RATE_LIMIT_PATH", os.path.join(data_dir, "rate_limits.db")))
+
+    def _connect(self):
+        # Short-lived connections keep this safe across threads and forks
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def hit(self, action, checks):
+        """Record one attempt against every (rule, key) pair, or reject it.
+
+        Returns (allowed, retry_after_seconds, rule_name). Nothing is recorded
+        when any rule rejects the attempt.
+        """
+        checks = [(rule, f"{rule.name}:{key}") for rule, key in checks if rule is not None and key]
+        now = time.time()
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for rule, key in checks:
+                    count = conn.execute(
+                        "SELECT COUNT(*) FROM rate_limit_events WHERE key = ? AND ts > ?",
+                        (key, now - rule.window)
+                    ).fetchone()[0]
+                    if count >= rule.limit:
+                        # The attempt is allowed again once enough old ones slide out
+                        oldest = conn.execute(
+                            "SELECT ts FROM rate_limit_events WHERE key = ? AND ts > ? "
+                            "ORDER BY ts LIMIT 1 OFFSET ?",
+                            (key, now - rule.window, count - rule.limit)
+                        ).fetchone()[0]
+                        conn.execute("ROLLBACK")
+                        RATE_LIMIT_CHECKS.inc(action=action, result="limited")
+                        RATE_LIMITED.inc(rule=rule.name)
+                        return False, max(1.0, oldest + rule.window - now), rule.name
+                conn.executemany(
+                    "INSERT INTO rate_limit_events (key, ts, expires_at) VALUES (?, ?, ?)",
+                    [(key, now, now + rule.window) for rule, key in checks]
+                )
+                self._calls += 1
+                if self._calls % 100 == 0:
+                    conn.execute("DELETE FROM rate_limit_events WHERE expires_at < ?", (now,))
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Rate limiter unavailable, allowing request: {str(e)}")
+            RATE_LIMIT_CHECKS.inc(action=action, result="error")
+            return True, 0.0, None
+
+        RATE_LIMIT_CHECKS.inc(action=action, result="allowed")
+        return True, 0.0, None
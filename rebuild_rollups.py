@@ -0,0 +1,29 @@
+import sys
+import time
+import argparse
+
+from app import app, db, User, MoodRollup, rebuild_mood_rollups
+
+# Recomputes the day/week/month mood rollups from progress_metrics. The API
+# keeps them current as check-ins arrive; run this once after upgrading, and
+# after loading metrics any other way (imports, generate_workload.py, manual
+# SQL). Safe to re-run: each user's rollups are replaced, not added to.
+
+parser = argparse.ArgumentParser(description="Rebuild mood rollups from progress metrics")
+parser.add_argument("--user-id", type=int, action="append", help="only this user (repeatable); default: everyone")
+parser.add_argument("--chunk-size", type=int, default=500, help="users per transaction")
+args = parser.parse_args()
+
+with app.app_context():
+    user_ids = args.user_id
+    if user_ids:
+        missing = set(user_ids) - set(db.session.scalars(db.select(User.id).where(User.id.in_(user_ids))))
+        if missing:
+            print(f"❌ No user with id {', '.join(map(str, sorted(missing)))}")
+            sys.exit(1)
+
+    started = time.perf_counter()
+    written = rebuild_mood_rollups(user_ids, chunk_size=args.chunk_size)
+    total = db.session.scalar(db.select(db.func.count()).select_from(MoodRollup))
+    print(f"✅ Wrote {written} rollup row(s) for {len(user_ids) if user_ids else 'all'} user(s) "
+          f"in {time.perf_counter() - started:.1f}s ({total} in the table)")
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+# =============================================
+# REQUEST COALESCING (SINGLE-FLIGHT)
+# =============================================
+#
+# Concurrent callers asking for the same key share one execution: the first
+# caller runs the function, the rest wait and receive its result or re-raise
+# its error. Nothing is kept once the call finishes, so this never serves a
+# stale answer - caching is chat_cache.py's job.
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _FlightStats:
+    def __init__(self):
+        self.executed = 0
+        self.coalesced = 0
+
+    def as_dict(self, in_flight):
+        total = self.executed + self.coalesced
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": in_flight,
+            "coalescing_ratio": round(self.coalesced / total, 3) if total else 0.0,
+        }
+
+
+class SingleFlight:
+    """Thread-based single-flight group for the sync WSGI workers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = _FlightStats()
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._stats.executed += 1
+            else:
+                self._stats.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return self._stats.as_dict(len(self._flights))
+
+
+class AsyncSingleFlight:
+    """asyncio single-flight group for the ASGI chat path (one event loop)"""
+
+    def __init__(self):
+        self._tasks = {}
+        self._stats = _FlightStats()
+
+    async def do(self, key, coro_fn):
+        task = self._tasks.get(key)
+        if task is None:
+            # Run the shared call as its own task so one waiter disconnecting
+            # does not cancel it for everyone else
+            task = asyncio.ensure_future(coro_fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self._stats.executed += 1
+        else:
+            self._stats.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    def stats(self):
+        return self._stats.as_dict(len(self._tasks))
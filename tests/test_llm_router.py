@@ -0,0 +1,154 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+from llm_providers import LLMProvider, LLMRouter, LLM_ROUTER_EVENTS
+
+# =============================================
+# LLM ROUTER AGAINST LOCAL STUB SERVERS
+# =============================================
+#
+# Each stub is an OpenAI-compatible /v1/chat/completions endpoint on
+# 127.0.0.1 that answers after `delay` seconds with its own name as the reply,
+# or with an HTTP error for the requests listed in `failures`. The router
+# talks to the stubs through the real pooled SDK clients, so timeouts and
+# retries behave as they do in production.
+
+
+class StubLLM(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, name, delay=0.0, failures=()):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.name = name
+        self.delay = delay
+        self.failures = set(failures)  # request numbers (1-based) answered with a 500
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def provider(self):
+        return LLMProvider(self.name, "stub-model", base_url=self.base_url, api_key="test")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server._lock:
+            self.server.requests += 1
+            number = self.server.requests
+        time.sleep(self.server.delay)
+        if number in self.server.failures:
+            status, body = 500, {"error": {"message": "stub failure", "type": "server_error"}}
+        else:
+            status, body = 200, {
+                "id": f"chatcmpl-{number}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "stub-model",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": self.server.name}}],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+            }
+        payload = json.dumps(body).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            pass  # the router gave up on this request
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stubs():
+    """Starts stub servers: stubs(name, delay=..., failures=...)"""
+    servers = []
+
+    def start(name, **options):
+        server = StubLLM(name, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def test_routes_to_the_faster_provider(stubs):
+    slow, fast = stubs("slow", delay=0.3), stubs("fast", delay=0.01)
+    router = LLMRouter([slow.provider(), fast.provider()], hedge_delay=0, deadline=5)
+    # Unmeasured providers are explored first; after that the lower p95 wins
+    for _ in range(6):
+        router.complete(MESSAGES)
+    assert (slow.requests, fast.requests) == (3, 3)
+
+    replies = [router.complete(MESSAGES).provider for _ in range(3)]
+    assert replies == ["fast", "fast", "fast"]
+    assert slow.requests == 3
+
+
+def test_routes_away_from_a_failing_provider(stubs):
+    flaky, steady = stubs("flaky", failures=(1, 2)), stubs("steady", delay=0.05)
+    router = LLMRouter([flaky.provider(), steady.provider()], hedge_delay=0, deadline=5)
+    for _ in range(4):
+        assert router.complete(MESSAGES).text in ("flaky", "steady")
+    assert flaky.requests == 3
+
+    # flaky is faster, but its error rate costs more than steady's extra latency
+    assert router.complete(MESSAGES).provider == "steady"
+    assert flaky.requests == 3
+
+
+def test_hedges_a_slow_provider_and_returns_the_winner(stubs):
+    slow, fast = stubs("slow", delay=1.5), stubs("fast", delay=0.01)
+    router = LLMRouter([slow.provider(), fast.provider()], hedge_delay=0.2, deadline=5)
+    fired, won = LLM_ROUTER_EVENTS.value(event="hedge_fired"), LLM_ROUTER_EVENTS.value(event="hedge_won")
+
+    started = time.monotonic()
+    completion = router.complete(MESSAGES)
+    elapsed = time.monotonic() - started
+
+    assert completion.provider == "fast" and completion.text == "fast"
+    assert 0.2 <= elapsed < 1.0
+    assert (slow.requests, fast.requests) == (1, 1)
+    assert LLM_ROUTER_EVENTS.value(event="hedge_fired") == fired + 1
+    assert LLM_ROUTER_EVENTS.value(event="hedge_won") == won + 1
+
+
+def test_fails_over_when_a_provider_returns_5xx(stubs):
+    broken, backup = stubs("broken", failures=range(1, 100)), stubs("backup")
+    router = LLMRouter([broken.provider(), backup.provider()], hedge_delay=0, deadline=5)
+
+    completion = router.complete(MESSAGES)
+
+    assert completion.provider == "backup"
+    # One attempt per provider: the SDK does not retry the 500 itself
+    assert (broken.requests, backup.requests) == (1, 1)
+
+
+@pytest.mark.parametrize("hedge_delay", [0, 0.3])
+def test_finishes_within_the_total_deadline(stubs, hedge_delay):
+    hung = [stubs("hung-a", delay=5), stubs("hung-b", delay=5)]
+    router = LLMRouter([server.provider() for server in hung], hedge_delay=hedge_delay, deadline=1)
+
+    started = time.monotonic()
+    with pytest.raises((TimeoutError, openai.APITimeoutError)):
+        router.complete(MESSAGES)
+    assert time.monotonic() - started < 1.5